@@ -1,7 +1,13 @@
 from flask import Flask, render_template, g, session
-from db import get_db, init_db
+import db
+from db import get_db
 import os
-from utils import resolve_storage_path
+from utils import human_size
+import decode_queue
+import capture_index
+import pass_cache
+from pass_cache import utc_iso
+from datetime import datetime
 
 # Import blueprints
 from blueprints.captures import bp as captures_bp
@@ -13,18 +19,42 @@ from blueprints.locations import bp as locations_bp
 from blueprints.ssdv import bp as ssdv_bp
 
 
+UPCOMING_PASSES = 10
+
+# File sizes come from the capture index; nothing on disk is touched here
+RECENT_CAPTURES_SQL = """SELECT capture_session.*, capture_file.size_bytes, capture_file.duration_s
+    FROM capture_session LEFT JOIN capture_file ON capture_file.capture_session_id = capture_session.id
+    ORDER BY capture_session.start_time_utc DESC"""
+
+# CROSS JOIN keeps satellite_pass as the outer loop, walking idx_satellite_pass_aos
+# up to the LIMIT; with few satellites the planner would rather sort every pass
+UPCOMING_PASSES_SQL = """SELECT satellite_pass.*, satellite.name AS satellite_name, location.name AS location_name
+    FROM satellite_pass CROSS JOIN satellite ON satellite.id = satellite_pass.satellite_id
+    CROSS JOIN location ON location.id = satellite_pass.location_id
+    WHERE satellite_pass.aos_utc >= ? ORDER BY satellite_pass.aos_utc LIMIT ?"""
+
+
 def create_app():
     app = Flask(__name__)
     app.config['DATABASE'] = os.path.join(app.root_path, 'observations.db')
+    app.config['SKYPLOT_CACHE'] = os.path.join(app.root_path, 'skyplot_cache')
     app.secret_key = 'replace-this-with-a-secure-key'
     
     app.config.from_prefixed_env()
     app.config["SPACETRACK_USER"] = os.getenv('SPACETRACK_USER')
     app.config["SPACETRACK_PASS"] = os.getenv('SPACETRACK_PASS')
 
-    # Initialize the database
-    with app.app_context():
-        init_db()
+    # Initialize the database and close connections on teardown
+    db.init_app(app)
+
+    # Background decoder jobs, one worker per core by default
+    decode_queue.init_app(app)
+
+    # Capture file sizes/durations, rescanned in the background
+    capture_index.init_app(app)
+
+    # Upcoming passes per satellite and location, predicted in the background
+    pass_cache.init_app(app)
 
     # Register blueprints
     app.register_blueprint(captures_bp)
@@ -50,42 +80,22 @@ def create_app():
     @app.route("/")
     def index():
         db = get_db()
-        captures = db.execute("SELECT * FROM capture_session ORDER BY start_time_utc DESC").fetchall() 
-     
-        # Build list with file size info 
-        capture_list = [] 
-        for row in captures: 
-            filename = row["start_time_utc"].replace(":", "").replace("-", "").replace("T", "_") + ".wav" 
-            full_path = resolve_storage_path(row["output_path"], filename)
-             
-            try: 
-                size_bytes = os.path.getsize(full_path) 
-                for unit in ['B', 'KB', 'MB', 'GB']: 
-                    if size_bytes < 1024: 
-                        size_str = f"{size_bytes:.1f} {unit}" 
-                        break 
-                    size_bytes /= 1024 
-                else: 
-                    size_str = f"{size_bytes:.1f} TB" 
-            except FileNotFoundError: 
-                size_str = "N/A" 
-                
-            capture_list.append(
-                { **dict(row), "filename": filename, "filesize": size_str }
-            )
+        captures = db.execute(RECENT_CAPTURES_SQL).fetchall()
+
+        capture_list = [
+            { **dict(row), "filename": row["wav_filename"], "filesize": human_size(row["size_bytes"]) }
+            for row in captures
+        ]
              
-        return render_template("index.html", captures=capture_list)
+        passes = db.execute(UPCOMING_PASSES_SQL, (utc_iso(datetime.utcnow()), UPCOMING_PASSES)).fetchall()
+
+        return render_template("index.html", captures=capture_list, passes=passes)
         
 
     @app.template_filter('filesize')
     def filesize(path):
         try:
-            size = os.path.getsize(path)
-            for unit in ['B', 'KB', 'MB', 'GB']:
-                if size < 1024:
-                    return f"{size:.1f} {unit}"
-                size /= 1024
-            return f"{size:.1f} TB"
+            return human_size(os.path.getsize(path))
         except Exception:
             return "N/A"
 
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, send_file, url_for, flash, jsonify, current_app
+from flask import Blueprint, render_template, request, redirect, send_file, send_from_directory, url_for, flash, jsonify, current_app
 from werkzeug.exceptions import abort
 from db import get_db
 from tle_plot import generate_orbit_plots
@@ -7,10 +7,27 @@ from datetime import datetime
 import subprocess
 import os
 from utils import app_path, resolve_storage_path
+from capture_index import get_capture_index
+from pass_cache import get_pass_cache, store_tle, upcoming_passes
+from pass_planner import plan_passes
+from skyplot_cache import FORMATS as SKYPLOT_FORMATS, KEEP_S as SKYPLOT_KEEP_S, skyplot_name, cached_skyplot
 import logging
 
 bp = Blueprint("captures", __name__, url_prefix="/captures")
 
+# Queries the routes run; query_plans.py checks that each one uses an index
+LIST_SQL = """SELECT capture_session.id, capture_session.start_time_utc,
+    satellite.name AS satellite_name, operator.name AS operator_name, capture_session.wav_path
+    FROM (capture_session
+    INNER JOIN satellite ON capture_session.satellite_id = satellite.id
+    INNER JOIN operator ON capture_session.operator_id = operator.id ) ORDER BY capture_session.id DESC"""
+SATELLITES_SQL = "SELECT id, name FROM satellite ORDER BY name"
+LOCATIONS_SQL = "SELECT * FROM location ORDER BY name"
+LOCATION_SQL = "SELECT * FROM location WHERE id = ?"
+CATALOG_NUMBER_SQL = "SELECT catalog_number FROM satellite WHERE id = ?"
+CAPTURE_SQL = "SELECT * FROM capture_session WHERE id = ?"
+CAPTURE_FILE_SQL = "SELECT output_path, start_time_utc FROM capture_session WHERE wav_filename = ?"
+
 logging.basicConfig(filename='app.log', level=logging.DEBUG,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -18,11 +35,7 @@ logging.basicConfig(filename='app.log', level=logging.DEBUG,
 def index():
     db = get_db()
     
-    captures = db.execute("""SELECT capture_session.id, capture_session.start_time_utc, 
-        satellite.name AS satellite_name, operator.name AS operator_name, capture_session.wav_path 
-        FROM (capture_session 
-        INNER JOIN satellite ON capture_session.satellite_id = satellite.id 
-        INNER JOIN operator ON capture_session.operator_id = operator.id ) ORDER BY capture_session.id DESC""").fetchall()
+    captures = db.execute(LIST_SQL).fetchall()
         
     return render_template("captures/list.html", captures=captures)
      
@@ -30,8 +43,8 @@ def index():
 @bp.route("/new", methods=["GET", "POST"])
 def new():
     db = get_db()
-    satellites = db.execute("SELECT id, name FROM satellite ORDER BY name").fetchall()
-    locations = db.execute("SELECT * FROM location ORDER BY name").fetchall()
+    satellites = db.execute(SATELLITES_SQL).fetchall()
+    locations = db.execute(LOCATIONS_SQL).fetchall()
 
     if request.method == "POST":
         satellite_id = request.form["satellite_id"]
@@ -55,13 +68,16 @@ def new():
         filename = start_time_utc.replace(":", "").replace("-", "").replace("T", "_") + ".wav" 
         wav_path = resolve_storage_path(output_path, filename)
         
-        db.execute( 
+        cur = db.execute( 
             """INSERT INTO capture_session 
-            (satellite_id, location_id, center_freq_hz, tle_line1, tle_line2, observer_timezone, operator_id, output_path, wav_path, start_time_utc, created_at, notes) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", 
-            (satellite_id, location_id, center_freq, tle1, tle2, tz, operator_id, output_path, wav_path, start_time_utc, created_at, notes))
+            (satellite_id, location_id, center_freq_hz, tle_line1, tle_line2, observer_timezone, operator_id, output_path, wav_path, wav_filename, start_time_utc, created_at, notes) 
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", 
+            (satellite_id, location_id, center_freq, tle1, tle2, tz, operator_id, output_path, wav_path, filename, start_time_utc, created_at, notes))
+        new_tle = store_tle(db, satellite_id, tle1.strip(), tle2.strip(), "capture")
 
         db.commit()
+        if new_tle:
+            get_pass_cache().wake()
         
         os.getcwd
          
@@ -72,8 +88,9 @@ def new():
                "--freq", str(center_freq),
                "--outfile", wav_path
                ]
-        # Launch it in the background 
-        subprocess.Popen(cmd)
+        # Launch it in the background; index the WAV once the recorder exits
+        proc = subprocess.Popen(cmd)
+        get_capture_index().watch(proc, cur.lastrowid)
         
         flash("Capture session created.")
         return redirect(url_for("index"))
@@ -84,7 +101,7 @@ def new():
 @bp.route("/fetch_tle/<int:sat_id>")
 def fetch_tle(sat_id):
     db = get_db()
-    sat = db.execute("SELECT catalog_number FROM satellite WHERE id = ?", (sat_id,)).fetchone()
+    sat = db.execute(CATALOG_NUMBER_SQL, (sat_id,)).fetchone()
     if not sat:
         return jsonify({"error": "Satellite not found"}), 404
 
@@ -108,6 +125,10 @@ def fetch_tle(sat_id):
         if resp.ok:
             lines = resp.text.strip().splitlines()
             if len(lines) >= 2:
+                new_tle = store_tle(db, sat_id, lines[0].strip(), lines[1].strip(), "space-track")
+                db.commit()
+                if new_tle:
+                    get_pass_cache().wake()
                 return jsonify({
                     "tle_line1": lines[0],
                     "tle_line2": lines[1]
@@ -127,7 +148,7 @@ def preview_orbit():
         tle2 = request.form["tle_line2"].strip()
 
         location_id = request.form["location_id"]
-        loc = db.execute("SELECT * FROM location WHERE id = ?", (location_id,)).fetchone()
+        loc = db.execute(LOCATION_SQL, (location_id,)).fetchone()
         lat = loc["lat_deg"]
         lon = loc["lon_deg"]
         elev = loc["elev_m"]
@@ -135,25 +156,63 @@ def preview_orbit():
         tz = request.form.get("timezone", "UTC")
         if tz == "custom":
             tz = request.form.get("timezone_custom", "UTC")
+        # png / svg: a URL to the cached plot; tracks: the alt/az arrays only
+        skyplot_format = request.form.get("skyplot_format", "png")
 
         if not tle1 or not tle2:
             return jsonify({"error": "TLE lines cannot be empty"}), 400
 
-        result = generate_orbit_plots(tle1, tle2, lat, lon, elev, tz) 
+        # Passes predicted in the background from this same TLE, if any
+        passes = None
+        satellite_id = request.form.get("satellite_id", type=int)
+        if satellite_id is not None:
+            passes = upcoming_passes(db, satellite_id, loc["id"], tle1, tle2)
+
+        result = generate_orbit_plots(tle1, tle2, lat, lon, elev, tz, location_id=loc["id"], passes=passes)
+        if skyplot_format in SKYPLOT_FORMATS:
+            name = skyplot_name(tle1, tle2, loc["id"], tz, skyplot_format)
+            cached_skyplot(current_app.config["SKYPLOT_CACHE"], name, result.pop("tracks"))
+            result["skyplot_url"] = url_for("captures.skyplot", name=name)
         return jsonify(result)
 
     except Exception as e:
         return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
         
 
+@bp.route("/skyplot/<name>")
+def skyplot(name):
+    """A cached sky plot.  The name is a hash of everything that went into
+    the plot, so the file never changes and browsers may keep it."""
+    fmt = name.rsplit(".", 1)[-1]
+    if fmt not in SKYPLOT_FORMATS:
+        abort(404)
+    response = send_from_directory(current_app.config["SKYPLOT_CACHE"], name,
+                                   mimetype=SKYPLOT_FORMATS[fmt], max_age=SKYPLOT_KEEP_S)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@bp.route("/plan")
+def plan():
+    """Upcoming passes of every satellite over every location as one
+    timeline (JSON), with overlapping passes at a location marked.
+    ?days= (default 2, at most 7) and ?min_elevation= (degrees) are optional."""
+    days = request.args.get("days", 2, type=float)
+    min_elevation = request.args.get("min_elevation", 10.0, type=float)
+    try:
+        result = plan_passes(current_app.config["DATABASE"], days, min_elevation)
+    except Exception as e:
+        return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
+    result["conflict_count"] = sum(1 for p in result["passes"] if p["conflicts"])
+    return jsonify(result)
+
+
 @bp.route("/captures/files/<path:filename>") 
 def serve_capture_file(filename): 
     # Look up the full path from the database 
     db = get_db() 
-    row = db.execute( 
-        "SELECT output_path, start_time_utc FROM capture_session WHERE start_time_utc || '.wav' = ?", 
-        (filename,) 
-        ).fetchone()
+    row = db.execute(CAPTURE_FILE_SQL, (filename,)).fetchone()
         
     if row is None: 
         abort(404)
@@ -174,7 +233,7 @@ def edit_capture(id):
         db.commit()
         return redirect(url_for("captures.index"))
 
-    capture = db.execute("SELECT * FROM capture_session WHERE id = ?", (id,)).fetchone()
+    capture = db.execute(CAPTURE_SQL, (id,)).fetchone()
     if capture is None:
         abort(404)
     return render_template("captures/edit.html", capture=capture)
@@ -183,13 +242,13 @@ def edit_capture(id):
 @bp.route("/<int:id>/")
 def view_capture(id):
     db = get_db()
-    capture_data = db.execute("SELECT * FROM capture_session WHERE id = ?",(id, )).fetchone()
+    capture_data = db.execute(CAPTURE_SQL, (id,)).fetchone()
     return render_template("captures/view.html", capture_data=capture_data)
     
 
 @bp.route("/captures/<int:id>/")
 def view_capture_2(id):
     db = get_db()
-    capture_data = db.execute("SELECT * FROM capture_session WHERE id = ?",(id, )).fetchone()
+    capture_data = db.execute(CAPTURE_SQL, (id,)).fetchone()
     return render_template("captures/view.html", capture_data=capture_data)
 
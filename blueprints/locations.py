@@ -1,12 +1,16 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from db import get_db
+from tle_plot import evict_observer
+from pass_cache import get_pass_cache, invalidate_location
 
 bp = Blueprint("locations", __name__, url_prefix="/locations")
 
+LIST_SQL = "SELECT * FROM location ORDER BY name"
+
 @bp.route("/")
 def index():
     db = get_db()
-    locations = db.execute("SELECT * FROM location ORDER BY name").fetchall()
+    locations = db.execute(LIST_SQL).fetchall()
     return render_template("locations/index.html", locations=locations)
 
 @bp.route("/new", methods=["GET", "POST"])
@@ -23,6 +27,7 @@ def new():
             (name, lat, lon, elev)
         )
         db.commit()
+        get_pass_cache().wake()
         flash("Location added.")
         return redirect(url_for("locations.index"))
 
@@ -43,7 +48,10 @@ def edit(id):
             "UPDATE location SET name = ?, lat_deg = ?, lon_deg = ?, elev_m = ? WHERE id = ?",
             (name, lat, lon, elev, id)
         )
+        invalidate_location(db, id)
         db.commit()
+        evict_observer(id)
+        get_pass_cache().wake()
         flash("Location updated.")
         return redirect(url_for("locations.index"))
 
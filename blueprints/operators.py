@@ -3,10 +3,12 @@ from db import get_db
 
 bp = Blueprint("operators", __name__, url_prefix="/operators")
 
+LIST_SQL = "SELECT * FROM operator ORDER BY name"
+
 @bp.route("/")
 def list_operators():
     db = get_db()
-    ops = db.execute("SELECT * FROM operator ORDER BY name").fetchall()
+    ops = db.execute(LIST_SQL).fetchall()
     return render_template("operators/list.html", ops=ops)
 
 @bp.route("/add")
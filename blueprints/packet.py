@@ -3,8 +3,10 @@ from db import get_db
 
 bp = Blueprint("packet", __name__, url_prefix="/packet")
 
+DETAIL_SQL = "SELECT * FROM packet_hex WHERE id = ?"
+
 @bp.route("/<int:id>")
 def detail(id):
     db = get_db()
-    packet = db.execute("SELECT * FROM packet WHERE id = ?", (id,)).fetchone()
+    packet = db.execute(DETAIL_SQL, (id,)).fetchone()
     return render_template("packet/detail.html", packet=packet)
@@ -1,30 +1,94 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, Response, stream_with_context, current_app
+from werkzeug.exceptions import abort
 from db import get_db
-import sys
-import subprocess
-import requests
 from datetime import datetime
 import logging
 from utils import app_path, resolve_storage_path
-import os
+from decode_queue import get_decode_queue
+from capture_metadata import read_wav_header
+from segmented_decode import MAX_SEGMENTS, segment_bounds, merge_segment_packets
+import io
+import csv
+import struct
+import json
 
 logging.basicConfig(filename='app.log', level=logging.DEBUG,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
 bp = Blueprint("processing", __name__, url_prefix="/processing")
 
+# Queries the routes run; query_plans.py checks that each one uses an index
+LIST_SQL = "SELECT * FROM processing_run ORDER BY id DESC"
+RUN_SQL = "SELECT * FROM processing_run WHERE id = ?"
+RUN_EXISTS_SQL = "SELECT 1 FROM processing_run WHERE id = ?"
+SESSIONS_SQL = "SELECT id FROM capture_session ORDER BY id DESC"
+SOURCE_FILE_SQL = "SELECT wav_path FROM capture_session WHERE capture_session.id = ?"
+CAPTURE_TIMING_SQL = """SELECT capture_session.duration_s, capture_session.sample_rate,
+    capture_file.duration_s AS file_duration_s, capture_file.sample_rate AS file_sample_rate
+    FROM capture_session LEFT JOIN capture_file ON capture_file.capture_session_id = capture_session.id
+    WHERE capture_session.id = ?"""
+SWEEP_SQL = "SELECT * FROM sweep WHERE id = ?"
+SWEEP_RUNS_SQL = """SELECT * FROM processing_run WHERE sweep_id = ?
+    ORDER BY COALESCE(good_packets, 0) DESC, COALESCE(packet_count, 0) DESC, id"""
+
+def insert_run(db, capture_session_id, source_file, output_path, freq_offset, doppler_en,
+               access_threshold, store_packets, is_ssdv, notes, sweep_id=None):
+    """Insert a processing_run row and return its id (caller commits).
+    The packet counters start at zero; the decoder's packet writer adds to them."""
+    start_time_utc = datetime.utcnow().isoformat()
+    cur = db.execute(""" INSERT INTO processing_run (source_file, start_time_utc, output_path, capture_session_id, freq_offset_hz, doppler_en, access_threshold, store_packets, is_ssdv, notes, sweep_id,
+    packet_count, good_packets, header_ok_packets, scrambler_ok_packets) 
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 0, 0, 0) 
+    """, (source_file, start_time_utc, output_path, capture_session_id, freq_offset, doppler_en, access_threshold, store_packets, is_ssdv, notes, sweep_id)) 
+    return cur.lastrowid
+
+
+def decoder_command(script_path, source_file, capture_session_id, run_id, freq_offset,
+                    doppler_en, access_threshold, store_packets, output_path, active_only=0,
+                    segment=None):
+    """Command line for passdata_headless.py / passdata_playback.py; only the
+    headless decoder takes --active-only and a (index, (start_s, stop_s)) segment."""
+    cmd = [ "python3", script_path,
+             "--source-file", source_file,
+             "--capture-session-id", str(capture_session_id),
+             "--frequency-offset", str(freq_offset), 
+             "--processing-run-id", str(run_id), 
+             "--doppler-en", str(doppler_en), 
+             "--access-threshold", str(access_threshold),
+             "--store-packets", str(store_packets),
+             "--output-path", output_path
+             ]
+    if active_only:
+        cmd += ["--active-only", "1"]
+    if segment is not None:
+        index, (start_s, stop_s) = segment
+        cmd += ["--segment", str(index), "--start-s", str(start_s), "--stop-s", str(stop_s)]
+    return cmd
+
+
+def capture_timing(db, capture_session_id, source_file_resolved):
+    """(duration_s, sample_rate) of a capture, from its stored metadata, the
+    capture file index, or failing both its WAV header; (None, None) if the
+    WAV can't be read."""
+    row = db.execute(CAPTURE_TIMING_SQL, (capture_session_id,)).fetchone()
+    if row['duration_s'] and row['sample_rate']:
+        return row['duration_s'], row['sample_rate']
+    if row['file_duration_s'] and row['file_sample_rate']:
+        return row['file_duration_s'], row['file_sample_rate']
+    try:
+        header = read_wav_header(source_file_resolved)
+    except (OSError, ValueError, struct.error) as e:
+        logging.error(f"capture {capture_session_id}: no WAV header in {source_file_resolved}: {e}")
+        return None, None
+    return header["frames"] / header["sample_rate"], header["sample_rate"]
+
+
 @bp.route('/') 
 def index(): 
     db = get_db() 
     
-    last_run = db.execute("SELECT MAX(processing_run_id) FROM packet").fetchone()[0]
-    if last_run is not None:        
-        packet_count = db.execute("SELECT COUNT(packet_index) FROM packet WHERE processing_run_id=?", (last_run,)).fetchone()[0]
-        good_packet_count = db.execute("SELECT COUNT(packet_index) FROM packet WHERE processing_run_id=? AND crc_ok=1", (last_run,)).fetchone()[0]
-        cur = db.execute(""" UPDATE processing_run SET packet_count = ?, good_packets = ? WHERE id = ?""", (packet_count, good_packet_count, last_run)) 
-        db.commit() 
-    
-    runs = db.execute("SELECT * FROM processing_run ORDER BY id DESC").fetchall()
+    # Packet counters are kept up to date by the decoder's packet writer
+    runs = db.execute(LIST_SQL).fetchall()
     
     return render_template('processing/index.html', runs=runs)
 
@@ -39,6 +103,9 @@ def new():
         store_packets = int(request.form.get('store_packets_choice'))
         output_path = 'received_packets/'  # default relative to app root
         ssdv_choice = request.form.get('ssdv')
+        show_gui = int(request.form.get('show_gui_choice', 0))
+        active_only = int(request.form.get('active_only_choice', 0))
+        segments = min(MAX_SEGMENTS, max(1, int(request.form.get('segments') or 1)))
         notes = request.form['notes']
         
         if ssdv_choice:
@@ -48,55 +115,287 @@ def new():
         
         
         db = get_db() 
-        source_file = db.execute("SELECT wav_path FROM capture_session WHERE capture_session.id = ?", (capture_session_id,)).fetchone()[0]
+        source_file = db.execute(SOURCE_FILE_SQL, (capture_session_id,)).fetchone()[0]
         source_file_resolved = resolve_storage_path(source_file)
         
         # logging.debug("Form data:", dict(request.form))
         # logging.debug(f'capture_session_id: {capture_session_id}')
-        start_time_utc = datetime.utcnow().isoformat()
-        filename = start_time_utc.replace(":", "").replace("-", "").replace("T", "_") + ".bin"
-        
-        cur = db.execute(""" INSERT INTO processing_run (source_file, start_time_utc, output_path, capture_session_id, freq_offset_hz, doppler_en, access_threshold, store_packets, is_ssdv, notes) 
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) 
-        """, (source_file, start_time_utc, output_path, capture_session_id, freq_offset, doppler_en, access_threshold, store_packets, is_ssdv, notes)) 
-        run_id = cur.lastrowid 
+        run_id = insert_run(db, capture_session_id, source_file, output_path, freq_offset,
+                            doppler_en, access_threshold, store_packets, is_ssdv, notes)
         db.commit()
         
-        output_file = os.path.join(output_path, filename)
-        
-        # Launch processing script 
-        script_path = app_path("gnuradio", "passdata_playback.py")
-
-        cmd = [ "python3", script_path,
-                "--source-file", source_file_resolved,
-                "--capture-session-id", capture_session_id,
-                "--frequency-offset", str(freq_offset), 
-                "--processing-run-id", str(run_id), 
-                "--doppler-en", str(doppler_en), 
-                "--access-threshold", str(access_threshold),
-                "--store-packets", str(store_packets),
-                "--output-path", output_path
-                ]
-        
-        # Launch it in the background 
-        subprocess.Popen(cmd)
+        # Launch processing script: headless (no GUI, unthrottled) unless
+        # the operator wants to watch the waterfall and scopes
+        if show_gui:
+            script_path = app_path("gnuradio", "passdata_playback.py")
+            active_only = 0  # the GUI plays the whole capture
+            segments = 1
+        else:
+            script_path = app_path("gnuradio", "passdata_headless.py")
+
+        duration_s = sample_rate = None
+        if segments > 1:
+            duration_s, sample_rate = capture_timing(db, capture_session_id, source_file_resolved)
+
+        # Queue it; the decode queue runs as many at once as there are cores
+        if duration_s:
+            # One headless process per overlapping time segment, all writing
+            # to this run; the last to finish drops the overlap duplicates
+            bounds = segment_bounds(duration_s, segments)
+            cmds = [decoder_command(script_path, source_file_resolved, capture_session_id, run_id,
+                                    freq_offset, doppler_en, access_threshold, store_packets,
+                                    output_path, active_only, segment)
+                    for segment in enumerate(bounds)]
+            db_path = current_app.config["DATABASE"]
+            get_decode_queue().submit_group(
+                run_id, cmds, lambda rid: merge_segment_packets(db_path, rid, sample_rate, bounds))
+        else:
+            cmd = decoder_command(script_path, source_file_resolved, capture_session_id, run_id,
+                                  freq_offset, doppler_en, access_threshold, store_packets, output_path,
+                                  active_only)
+            get_decode_queue().submit(run_id, cmd)
         
         return redirect(url_for('processing.index'))
         
     else:
         db = get_db() 
-        sessions = db.execute("SELECT id FROM capture_session ORDER BY id DESC").fetchall() 
-        return render_template("processing/new.html", sessions=sessions)
+        sessions = db.execute(SESSIONS_SQL).fetchall() 
+        return render_template("processing/new.html", sessions=sessions, max_segments=MAX_SEGMENTS)
                
     return render_template('processing/new.html')
 
 
+PACKETS_PER_PAGE = 100
+
+# List columns only; the hex fields are shown on the packet detail page
+PACKET_LIST_COLUMNS = """id, packet_index, length_bytes, payload_byte_count,
+    header_ok, scrambler_ok, crc_ok, packet_error_type"""
+
+
+def packet_filters(crc_ok):
+    """SQL conditions and parameters for the packet list filters.  There is
+    no error type filter: the decoder stores only frames that got as far as
+    the CRC check, so a stored packet's packet_error_type is always empty."""
+    where, params = [], []
+    if crc_ok in ("0", "1"):
+        where.append("crc_ok = ?")
+        params.append(int(crc_ok))
+    return where, params
+
+
+def packet_page_sql(where, order):
+    """One page of the packet list: packets matching the where conditions,
+    in id order (ASC or DESC), with the page size as the last parameter."""
+    return f"""SELECT {PACKET_LIST_COLUMNS} FROM packet WHERE {" AND ".join(where)}
+        ORDER BY id {order} LIMIT ?"""
+
+
 @bp.route('/<int:id>') 
 def view(id): 
     db = get_db() 
-    run = db.execute("SELECT * FROM processing_run WHERE id = ?", (id,)).fetchone() 
-    packets = db.execute("""
-     SELECT * FROM packet WHERE processing_run_id = ? ORDER BY id 
-     """, (id,)).fetchall()
-    
-    return render_template("processing/view.html", run=run, packets=packets)
+    run = db.execute(RUN_SQL, (id,)).fetchone() 
+    if run is None:
+        abort(404)
+
+    # Keyset pagination on (processing_run_id, id): ?after=<id> pages forward,
+    # ?before=<id> pages back, so no page costs more than PACKETS_PER_PAGE rows
+    crc_ok = request.args.get('crc_ok', '')
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
+
+    where, params = packet_filters(crc_ok)
+    where.insert(0, "processing_run_id = ?")
+    params.insert(0, id)
+    if before is not None:
+        where.append("id < ?")
+        params.append(before)
+        order = "DESC"
+    else:
+        where.append("id > ?")
+        params.append(after or 0)
+        order = "ASC"
+
+    packets = db.execute(packet_page_sql(where, order), (*params, PACKETS_PER_PAGE + 1)).fetchall()
+
+    more = len(packets) > PACKETS_PER_PAGE
+    packets = packets[:PACKETS_PER_PAGE]
+    if before is not None:
+        packets.reverse()
+    has_prev = (more if before is not None else after is not None) and bool(packets)
+    has_next = (more if before is None else True) and bool(packets)
+
+    filters = {"crc_ok": crc_ok} if crc_ok else {}
+    return render_template("processing/view.html", run=run, packets=packets,
+                           has_prev=has_prev, has_next=has_next, filters=filters,
+                           crc_ok=crc_ok)
+
+
+# Columns written by the CSV and JSON Lines exports; BLOB fields go out as hex
+EXPORT_COLUMNS = ["id", "processing_run_id", "packet_index", "capture_time_utc", "length_bytes",
+                  "header_ok", "payload_ok", "crc_ok", "scrambler_ok", "packet_error_type",
+                  "payload_byte_count", "header_hex", "header_parity_hex", "payload_hex",
+                  "payload_parity_hex", "crc_hex"]
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "bin": "application/octet-stream",
+}
+
+
+def export_sql(columns, where):
+    return f"SELECT {columns} FROM packet_hex WHERE {' AND '.join(where)} ORDER BY id"
+
+
+def export_rows(run_id, columns, crc_ok):
+    """Iterate the run's filtered packets in id order straight off the cursor.
+    The query runs once the response starts streaming, on the connection of
+    the streaming context; the request's own is closed by then."""
+    where, params = packet_filters(crc_ok)
+    where.insert(0, "processing_run_id = ?")
+    params.insert(0, run_id)
+    yield from get_db().execute(export_sql(columns, where), params)
+
+
+def export_csv(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow(tuple(row))
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+
+def export_jsonl(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n"
+
+
+def export_payloads(rows):
+    for (payload,) in rows:
+        yield payload
+
+
+@bp.route('/<int:id>/export.<fmt>')
+def export(id, fmt):
+    """Stream a run's packets as CSV, JSON Lines, or the raw payload bytes
+    back to back (.bin), honouring the same filters as the packet list.
+    Rows are read from the cursor as the response is sent, so memory use
+    does not grow with the size of the run."""
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    db = get_db()
+    if db.execute(RUN_EXISTS_SQL, (id,)).fetchone() is None:
+        abort(404)
+
+    crc_ok = request.args.get('crc_ok', '')
+    if fmt == "bin":
+        body = export_payloads(export_rows(id, "payload", crc_ok))
+    else:
+        rows = export_rows(id, ", ".join(EXPORT_COLUMNS), crc_ok)
+        body = export_csv(rows) if fmt == "csv" else export_jsonl(rows)
+
+    return Response(stream_with_context(body), mimetype=EXPORT_FORMATS[fmt],
+                    headers={"Content-Disposition": f"attachment; filename=run{id}_packets.{fmt}"})
+
+
+MAX_SWEEP_RUNS = 200
+
+def parse_grid(text, cast=int):
+    """Parse a sweep axis: comma separated values ("0, 500, -500") and/or
+    start:stop:step ranges with an inclusive stop ("-2000:2000:500").
+    Raises ValueError as soon as the axis has more than MAX_SWEEP_RUNS
+    values, rather than expanding a mistyped range in full."""
+    values = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if ":" in part:
+            start, stop, step = (cast(v) for v in part.split(":"))
+            if step <= 0:
+                raise ValueError(f"step must be positive: {part}")
+            v = start
+            while v <= stop:
+                values.append(v)
+                if len(values) > MAX_SWEEP_RUNS:
+                    raise ValueError(f"more than {MAX_SWEEP_RUNS} values: {part}")
+                v += step
+        else:
+            values.append(cast(part))
+            if len(values) > MAX_SWEEP_RUNS:
+                raise ValueError(f"more than {MAX_SWEEP_RUNS} values")
+    # keep order, drop repeats
+    return list(dict.fromkeys(values))
+
+
+@bp.route('/sweep/new', methods=['GET', 'POST'])
+def new_sweep():
+    db = get_db()
+    if request.method == 'POST':
+        capture_session_id = request.form['capture_session_id']
+        notes = request.form.get('notes', '')
+        try:
+            offsets = parse_grid(request.form['freq_offsets'])
+            thresholds = parse_grid(request.form['access_thresholds'])
+        except ValueError as e:
+            flash(f"Bad sweep grid: {e}")
+            return redirect(url_for('processing.new_sweep'))
+        dopplers = [int(d) for d in request.form.getlist('doppler_en')]
+        active_only = int(request.form.get('active_only_choice', 0))
+        store_packets = int(request.form.get('store_packets_choice', 0))
+
+        combos = [(o, t, d) for d in dopplers for t in thresholds for o in offsets]
+        if not combos:
+            flash("Sweep needs at least one offset, threshold and Doppler setting.")
+            return redirect(url_for('processing.new_sweep'))
+        if len(combos) > MAX_SWEEP_RUNS:
+            flash(f"Sweep has {len(combos)} combinations; the limit is {MAX_SWEEP_RUNS}.")
+            return redirect(url_for('processing.new_sweep'))
+
+        source_file = db.execute(SOURCE_FILE_SQL, (capture_session_id,)).fetchone()[0]
+        source_file_resolved = resolve_storage_path(source_file)
+        output_path = 'received_packets/'
+        script_path = app_path("gnuradio", "passdata_headless.py")
+
+        cur = db.execute("INSERT INTO sweep (capture_session_id, created_at, notes) VALUES (?, ?, ?)",
+                         (capture_session_id, datetime.utcnow().isoformat(), notes))
+        sweep_id = cur.lastrowid
+
+        # The per-run counts are kept by the packet writer whether or not
+        # the packets themselves are stored
+        jobs = []
+        for freq_offset, access_threshold, doppler_en in combos:
+            run_id = insert_run(db, capture_session_id, source_file, output_path, freq_offset,
+                                doppler_en, access_threshold, store_packets, 0, f"sweep {sweep_id}", sweep_id)
+            jobs.append((run_id, decoder_command(script_path, source_file_resolved, capture_session_id,
+                                                 run_id, freq_offset, doppler_en, access_threshold,
+                                                 store_packets, output_path, active_only)))
+        db.commit()
+
+        queue = get_decode_queue()
+        for run_id, cmd in jobs:
+            queue.submit(run_id, cmd)
+
+        return redirect(url_for('processing.view_sweep', id=sweep_id))
+
+    sessions = db.execute(SESSIONS_SQL).fetchall()
+    return render_template("processing/sweep_new.html", sessions=sessions)
+
+
+@bp.route('/sweep/<int:id>')
+def view_sweep(id):
+    db = get_db()
+    sweep = db.execute(SWEEP_SQL, (id,)).fetchone()
+    if sweep is None:
+        abort(404)
+    runs = db.execute(SWEEP_RUNS_SQL, (id,)).fetchall()
+
+    best = runs[0] if runs and runs[0]['good_packets'] else None
+    remaining = sum(1 for r in runs if r['status'] in ('queued', 'running'))
+
+    return render_template("processing/sweep_view.html", sweep=sweep, runs=runs,
+                           best=best, remaining=remaining)
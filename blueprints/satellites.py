@@ -4,10 +4,12 @@ from db import get_db
 
 bp = Blueprint("satellites", __name__, url_prefix="/satellites")
 
+LIST_SQL = "SELECT * FROM satellite ORDER BY name"
+
 @bp.route("/")
 def list_satellites():
     db = get_db()
-    sats = db.execute("SELECT * FROM satellite ORDER BY name").fetchall()
+    sats = db.execute(LIST_SQL).fetchall()
     return render_template("satellites/list.html", sats=sats)
 
 @bp.route("/edit/<int:id>")
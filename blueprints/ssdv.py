@@ -6,6 +6,8 @@ from utils import get_app_root
 
 bp = Blueprint('ssdv', __name__, url_prefix='/ssdv')
 
+OUTPUT_FILE_SQL = "SELECT output_file FROM processing_run WHERE id = ?"
+
 @bp.route('/run', methods=['POST'])
 def run():
     payload_file = request.form['payload_file']
@@ -14,7 +16,7 @@ def run():
     is_ssdv = int(request.form.get('is_ssdv', 0))
 
     db = get_db()
-    payload_file = db.execute("SELECT output_file FROM processing_run WHERE id = ?",(processing_run_id, )).fetchone()[0]
+    payload_file = db.execute(OUTPUT_FILE_SQL, (processing_run_id,)).fetchone()[0]
 
     # payload_file = os.path.join(get_app_root(), payload_file)
     output_image = os.path.join(get_app_root(), output_image)
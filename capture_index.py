@@ -0,0 +1,146 @@
+import os
+import struct
+import threading
+import logging
+import time
+from datetime import datetime
+from db import connect
+from utils import resolve_storage_path
+from capture_metadata import read_wav_header, store_capture_metadata
+
+# A WAV not modified for this long is taken to be complete
+SETTLE_S = 60
+
+
+class CaptureIndex:
+    """Keep the capture_file table in step with the WAV files on disk.
+
+    Pages read file size, duration and format from capture_file instead of
+    stat'ing every WAV on every request.  A background thread rescans every
+    `interval` seconds (only files whose size or mtime changed are reopened),
+    and a capture is refreshed as soon as its recorder exits.
+
+    Finished captures also get their metadata (duration, power envelope, peak
+    time) stored on capture_session, right after the recorder exits or, for
+    captures recorded before that, by the background thread.
+    """
+
+    def __init__(self, db_path, interval=300):
+        self.db_path = db_path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.start_lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """Start the background thread, once; later calls do nothing."""
+        with self.start_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop, name="capture-index", daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _loop(self):
+        while not self.stop_event.is_set():
+            try:
+                self.scan()
+                self.analyze_pending()
+            except Exception as e:
+                logging.error(f"capture index scan failed: {e}")
+            self.stop_event.wait(self.interval)
+
+    def scan(self, capture_session_id=None):
+        """Refresh capture_file for one capture session, or for all of them."""
+        sql = """SELECT capture_session.id, capture_session.output_path, capture_session.wav_filename,
+                 capture_file.scanned_at, capture_file.size_bytes, capture_file.mtime
+                 FROM capture_session LEFT JOIN capture_file
+                 ON capture_file.capture_session_id = capture_session.id"""
+        params = ()
+        if capture_session_id is not None:
+            sql += " WHERE capture_session.id = ?"
+            params = (capture_session_id,)
+
+        conn = connect(self.db_path)
+        try:
+            rows = conn.execute(sql, params).fetchall()
+            for id, output_path, wav_filename, scanned_at, old_size, old_mtime in rows:
+                path = resolve_storage_path(output_path, wav_filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    st = None
+                current = (st.st_size, st.st_mtime) if st is not None else (None, None)
+                if scanned_at is not None and current == (old_size, old_mtime):
+                    continue
+                with conn:
+                    conn.execute("""INSERT OR REPLACE INTO capture_file
+                        (capture_session_id, path, size_bytes, mtime, duration_s, sample_rate, channels, scanned_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (id, path, *self._describe(path, st), datetime.utcnow().isoformat()))
+        finally:
+            conn.close()
+
+    def _describe(self, path, st):
+        """(size_bytes, mtime, duration_s, sample_rate, channels) for path."""
+        if st is None:
+            return (None, None, None, None, None)
+        try:
+            header = read_wav_header(path)
+        except (OSError, ValueError, struct.error) as e:
+            logging.debug(f"capture index: no WAV header in {path}: {e}")
+            return (st.st_size, st.st_mtime, None, None, None)
+        return (st.st_size, st.st_mtime, header["frames"] / header["sample_rate"],
+                header["sample_rate"], header["channels"])
+
+    def analyze(self, capture_session_id):
+        """Store the capture's metadata (see capture_metadata)."""
+        conn = connect(self.db_path)
+        try:
+            row = conn.execute("SELECT path FROM capture_file WHERE capture_session_id = ? AND size_bytes IS NOT NULL",
+                               (capture_session_id,)).fetchone()
+            if row is not None:
+                store_capture_metadata(conn, capture_session_id, row[0])
+        finally:
+            conn.close()
+
+    def analyze_pending(self):
+        """Analyze settled captures that have no metadata yet."""
+        conn = connect(self.db_path)
+        try:
+            ids = [id for (id,) in conn.execute("""SELECT capture_session.id FROM capture_session
+                JOIN capture_file ON capture_file.capture_session_id = capture_session.id
+                WHERE capture_session.power_envelope IS NULL AND capture_file.sample_rate IS NOT NULL
+                AND capture_file.mtime < ?""", (time.time() - SETTLE_S,))]
+        finally:
+            conn.close()
+        for id in ids:
+            if self.stop_event.is_set():
+                break
+            self.analyze(id)
+
+    def watch(self, proc, capture_session_id):
+        """Refresh and analyze capture_session_id once the recorder process
+        `proc` exits."""
+        def wait():
+            proc.wait()
+            self.scan(capture_session_id)
+            self.analyze(capture_session_id)
+        threading.Thread(target=wait, name=f"capture-{capture_session_id}", daemon=True).start()
+
+
+def init_app(app):
+    """Create and start the app's capture index; FLASK_CAPTURE_SCAN_INTERVAL
+    sets the rescan period in seconds (default 300)."""
+    index = CaptureIndex(app.config["DATABASE"],
+                         float(app.config.get("CAPTURE_SCAN_INTERVAL") or 300))
+    app.extensions["capture_index"] = index
+    # Started by the first request rather than here: under the debug
+    # reloader create_app also runs in the watcher process, which serves none
+    app.before_request(index.start)
+
+
+def get_capture_index():
+    from flask import current_app
+    return current_app.extensions["capture_index"]
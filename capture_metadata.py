@@ -0,0 +1,116 @@
+import os
+import struct
+import logging
+import numpy as np
+
+# Seconds of audio read per numpy pass; bounds memory on multi-GB captures
+ENVELOPE_BLOCK_S = 10
+# Full-scale complex power of a 32-bit I/Q sample, the 0 dBFS reference
+FULL_SCALE_POWER = 2.0 * float(2 ** 31) ** 2
+
+
+def read_wav_header(path):
+    """
+    Walk the RIFF chunks of a WAV file up to its data chunk.
+
+    Returns a dict with sample_rate, channels, bits, data_offset and frames.
+    A capture still being written (or not closed cleanly) can have a wrong
+    data size in its header, so frames is taken from the file size.
+    """
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            raise ValueError(f"{path} is not a RIFF/WAVE file")
+
+        channels = sample_rate = bits = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt = f.read(chunk_size)
+                _, channels, sample_rate, _, _, bits = struct.unpack('<HHIIHH', fmt[:16])
+                f.seek(chunk_size & 1, 1)
+            elif chunk_id == b'data':
+                data_offset = f.tell()
+                break
+            else:
+                # chunks are word aligned
+                f.seek(chunk_size + (chunk_size & 1), 1)
+
+    if channels is None:
+        raise ValueError(f"{path} has no fmt chunk before its data chunk")
+
+    data_size = min(chunk_size, file_size - data_offset)
+    frames = data_size // (channels * bits // 8)
+    return {"sample_rate": sample_rate, "channels": channels, "bits": bits,
+            "data_offset": data_offset, "frames": frames}
+
+
+def power_envelope(path, header=None):
+    """
+    Per-second RMS power of a capture in dBFS, as a float32 array.
+
+    The WAV data is memory-mapped and reduced ENVELOPE_BLOCK_S seconds at a
+    time.  Each entry is the mean I^2 + Q^2 over one second; a trailing
+    partial second is averaged over what there is.  Only 32-bit I/Q (two
+    channel) captures, as written by rtlsdr_iq_capture.py, are supported.
+    """
+    header = header or read_wav_header(path)
+    if header["bits"] != 32 or header["channels"] != 2:
+        raise ValueError(f"{path} is not 32-bit I/Q ({header['channels']} ch, {header['bits']} bits)")
+
+    rate = header["sample_rate"]
+    frames = np.memmap(path, dtype='<i4', mode='r', offset=header["data_offset"],
+                       shape=(header["frames"], 2))
+
+    n_seconds = -(-header["frames"] // rate)
+    power = np.empty(n_seconds, dtype=np.float64)
+    block = ENVELOPE_BLOCK_S * rate
+    for start in range(0, header["frames"], block):
+        iq = frames[start:start + block].astype(np.float32)
+        p = np.einsum('ij,ij->i', iq, iq)  # I^2 + Q^2 per frame
+        whole = len(p) // rate
+        first = start // rate
+        power[first:first + whole] = p[:whole * rate].reshape(whole, rate).mean(axis=1)
+        if len(p) % rate:
+            power[first + whole] = p[whole * rate:].mean()
+
+    return (10.0 * np.log10(power / FULL_SCALE_POWER + 1e-30)).astype(np.float32)
+
+
+def capture_metadata(path):
+    """Header values, duration, power envelope and peak time for one WAV."""
+    header = read_wav_header(path)
+    envelope = power_envelope(path, header)
+    return {
+        "sample_rate": header["sample_rate"],
+        "frame_count": header["frames"],
+        "duration_s": header["frames"] / header["sample_rate"],
+        # middle of the loudest second
+        "peak_time_s": float(np.argmax(envelope)) + 0.5 if len(envelope) else None,
+        "power_envelope": envelope,
+    }
+
+
+def store_capture_metadata(conn, capture_session_id, path):
+    """Analyze the capture's WAV and save the results on its capture_session
+    row; returns False (and stores nothing) if the WAV can't be analyzed."""
+    try:
+        meta = capture_metadata(path)
+    except (OSError, ValueError) as e:
+        logging.error(f"capture {capture_session_id}: no metadata from {path}: {e}")
+        return False
+    with conn:
+        conn.execute("""UPDATE capture_session SET sample_rate = ?, frame_count = ?, duration_s = ?,
+            peak_time_s = ?, power_envelope = ? WHERE id = ?""",
+            (meta["sample_rate"], meta["frame_count"], meta["duration_s"], meta["peak_time_s"],
+             meta["power_envelope"].tobytes(), capture_session_id))
+    return True
+
+
+def load_power_envelope(blob):
+    """The power_envelope column back as a float32 array (dBFS per second)."""
+    return np.frombuffer(blob, dtype=np.float32) if blob else None
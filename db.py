@@ -1,22 +1,140 @@
+import os
 import sqlite3
 from flask import current_app, g
 
+# Columns added to existing tables after their first release.  schema.sql only
+# creates missing tables, so older databases get these through ALTER TABLE.
+COLUMN_MIGRATIONS = {
+    "capture_session": [
+        ("wav_filename", "TEXT"),
+        ("sample_rate", "INTEGER"),
+        ("frame_count", "INTEGER"),
+        ("duration_s", "REAL"),
+        ("peak_time_s", "REAL"),
+        ("power_envelope", "BLOB"),
+    ],
+    "processing_run": [
+        ("output_file", "TEXT"),
+        ("status", "TEXT"),
+        ("pid", "INTEGER"),
+        ("sweep_id", "INTEGER REFERENCES sweep(id)"),
+        ("header_ok_packets", "INTEGER"),
+        ("scrambler_ok_packets", "INTEGER"),
+    ],
+    "packet": [
+        ("sample_offset", "INTEGER"),
+        ("segment", "INTEGER"),
+    ],
+}
+
+# Applied to every connection.  WAL lets page reads run while a decoder
+# subprocess is inserting packets; busy_timeout makes a writer wait for the
+# other writer instead of failing with "database is locked".
+BUSY_TIMEOUT_MS = 30000
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA synchronous = NORMAL",  # safe with WAL, no fsync per commit
+    "PRAGMA cache_size = -16000",   # 16 MB page cache
+    "PRAGMA temp_store = MEMORY",
+]
+
+# packet's *_hex TEXT columns became BLOB columns without the suffix
+PACKET_BLOB_COLUMNS = ["header", "header_parity", "payload", "payload_parity", "crc"]
+
+def connect(path):
+    """Open a connection to path with the PRAGMAS applied."""
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000,
+                           detect_types=sqlite3.PARSE_DECLTYPES,
+                           check_same_thread=False)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
 def get_db():
+    """The request's connection, opened on first use and closed on teardown."""
     if "db" not in g:
-        g.db = sqlite3.connect(
-            current_app.config["DATABASE"],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
+        g.db = connect(current_app.config["DATABASE"])
         g.db.row_factory = sqlite3.Row
     return g.db
 
 def close_db(e=None):
+    """Teardown: close the request's connection; anything it left
+    uncommitted is rolled back."""
     db = g.pop("db", None)
     if db is not None:
         db.close()
 
+def init_app(app):
+    app.teardown_appcontext(close_db)
+    with app.app_context():
+        init_db()
+
+def to_blob(value):
+    """Old packet fields held raw bytes bound into TEXT columns, or hex text."""
+    if value is None or isinstance(value, bytes):
+        return value
+    try:
+        return bytes.fromhex(value)
+    except ValueError:
+        return value.encode()
+
+def migrate_db(db):
+    """Add missing columns to tables that already exist.  Runs before
+    schema.sql so its indexes can refer to the new columns."""
+    # A packet table with *_hex columns is set aside; schema.sql creates the
+    # BLOB version and backfill_db copies the rows over
+    packet_columns = {row[1] for row in db.execute('PRAGMA table_info("packet")')}
+    if "header_hex" in packet_columns:
+        for (name,) in db.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'packet' AND sql IS NOT NULL").fetchall():
+            db.execute(f'DROP INDEX "{name}"')
+        db.execute('ALTER TABLE packet RENAME TO packet_hex_old')
+
+    for table, columns in COLUMN_MIGRATIONS.items():
+        existing = {row[1] for row in db.execute(f'PRAGMA table_info("{table}")')}
+        if not existing:
+            continue  # new table, schema.sql creates it complete
+        for name, decl in columns:
+            if name not in existing:
+                db.execute(f'ALTER TABLE "{table}" ADD COLUMN "{name}" {decl}')
+    db.commit()
+
+def backfill_db(db):
+    """Fill columns added by migrate_db for rows written before they existed."""
+    # Packet rows set aside by migrate_db, converted to BLOBs
+    if db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'packet_hex_old'").fetchone():
+        db.create_function("to_blob", 1, to_blob, deterministic=True)
+        other = ("id", "processing_run_id", "packet_index", "capture_time_utc", "length_bytes",
+                 "header_ok", "payload_ok", "crc_ok", "scrambler_ok", "packet_error_type",
+                 "payload_byte_count")
+        columns = ", ".join(other + tuple(PACKET_BLOB_COLUMNS))
+        converted = ", ".join(other + tuple(f"to_blob({c}_hex)" for c in PACKET_BLOB_COLUMNS))
+        db.execute(f"INSERT INTO packet ({columns}) SELECT {converted} FROM packet_hex_old")
+        db.execute("DROP TABLE packet_hex_old")
+        db.commit()
+        db.execute("VACUUM")  # give the space back
+    rows = db.execute("SELECT id, wav_path FROM capture_session WHERE wav_filename IS NULL").fetchall()
+    db.executemany("UPDATE capture_session SET wav_filename = ? WHERE id = ?",
+                   [(os.path.basename(wav_path), id) for id, wav_path in rows])
+    # Runs from before the packet writer kept every counter: count them once
+    recount_runs(db, "header_ok_packets IS NULL")
+    db.commit()
+
+def recount_runs(db, where, params=()):
+    """Recompute the packet counters of the processing runs matching where."""
+    db.execute(f"""UPDATE processing_run SET
+        packet_count = (SELECT COUNT(*) FROM packet WHERE processing_run_id = processing_run.id),
+        good_packets = (SELECT COUNT(*) FROM packet WHERE processing_run_id = processing_run.id AND crc_ok = 1),
+        header_ok_packets = (SELECT COUNT(*) FROM packet WHERE processing_run_id = processing_run.id AND header_ok = 1),
+        scrambler_ok_packets = (SELECT COUNT(*) FROM packet WHERE processing_run_id = processing_run.id AND scrambler_ok = 1)
+        WHERE {where}""", params)
+
+def setup_db(db, schema):
+    """Bring a database of any age up to schema (the text of schema.sql)."""
+    migrate_db(db)
+    db.executescript(schema)
+    backfill_db(db)
+
 def init_db():
-    db = get_db()
     with current_app.open_resource("schema.sql") as f:
-        db.executescript(f.read().decode("utf8"))
-
+        setup_db(get_db(), f.read().decode("utf8"))
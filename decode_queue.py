@@ -0,0 +1,185 @@
+import os
+import subprocess
+import threading
+import logging
+from queue import Queue
+from db import connect
+
+
+# processing_run.status values
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _Group:
+    """Completion count shared by the jobs of one submit_group call."""
+
+    def __init__(self, count, on_complete):
+        self.left = count
+        self.failed = False
+        self.on_complete = on_complete
+        self.lock = threading.Lock()
+
+    def finish(self, ok):
+        """Record one job's exit; True for the last job of the group."""
+        with self.lock:
+            self.left -= 1
+            self.failed = self.failed or not ok
+            return self.left == 0
+
+
+class DecodeQueue:
+    """Run decoder subprocesses (passdata_playback / passdata_headless) with
+    at most `workers` running at once.
+
+    Each job belongs to a processing_run row; its status and PID are written
+    to that row as the job moves through queued -> running -> done/failed.
+    The worker threads only wait on their subprocess, so the decoding itself
+    runs in parallel across cores.  They are daemon threads: stopping the
+    server abandons the jobs still queued rather than running them all
+    first, and the next server marks those failed.
+    """
+
+    def __init__(self, db_path, workers=None):
+        self.db_path = db_path
+        self.workers = workers or os.cpu_count() or 1
+        self.jobs = Queue()
+        self.threads = [threading.Thread(target=self._work, name=f"decode_{i}", daemon=True)
+                        for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+        self.start_lock = threading.Lock()
+        self.started = False
+
+    def start(self):
+        """Mark the jobs an earlier server process left behind as failed,
+        once; later calls do nothing."""
+        with self.start_lock:
+            if not self.started:
+                self._fail_orphans()
+                self.started = True
+
+    def submit(self, run_id, cmd):
+        """Queue cmd for processing_run `run_id`."""
+        self._update(run_id, status=QUEUED, pid=None)
+        self.jobs.put((self._run, (run_id, cmd)))
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            target, args = job
+            try:
+                target(*args)
+            except Exception as e:
+                logging.error(f"decode job {args[0]} raised: {e}")
+
+    def _run(self, run_id, cmd):
+        try:
+            proc = subprocess.Popen(cmd)
+        except Exception as e:
+            logging.error(f"decode run {run_id} failed to start: {e}")
+            self._update(run_id, status=FAILED)
+            return None
+
+        self._update(run_id, status=RUNNING, pid=proc.pid)
+        returncode = proc.wait()
+        self._update(run_id, status=DONE if returncode == 0 else FAILED)
+        logging.debug(f"decode run {run_id} (pid {proc.pid}) exited with {returncode}")
+        return returncode
+
+    def submit_group(self, run_id, cmds, on_complete=None):
+        """Queue several commands that together make up processing_run
+        `run_id` (the segments of a segmented decode).  The run is running
+        from the first start to the last exit; then on_complete(run_id) is
+        called, unless a command failed, before the run is marked done."""
+        self._update(run_id, status=QUEUED, pid=None)
+        group = _Group(len(cmds), on_complete)
+        for cmd in cmds:
+            self.jobs.put((self._run_part, (run_id, cmd, group)))
+
+    def _run_part(self, run_id, cmd, group):
+        try:
+            proc = subprocess.Popen(cmd)
+        except Exception as e:
+            logging.error(f"decode run {run_id} failed to start a segment: {e}")
+            returncode = None
+        else:
+            self._update(run_id, status=RUNNING, pid=proc.pid)
+            returncode = proc.wait()
+            logging.debug(f"decode run {run_id} segment (pid {proc.pid}) exited with {returncode}")
+
+        if not group.finish(returncode == 0):
+            return returncode
+        ok = not group.failed
+        if ok and group.on_complete is not None:
+            try:
+                group.on_complete(run_id)
+            except Exception as e:
+                logging.error(f"decode run {run_id} failed to merge its segments: {e}")
+                ok = False
+        self._update(run_id, status=DONE if ok else FAILED)
+        return returncode
+
+    def _update(self, run_id, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn = connect(self.db_path)
+        try:
+            with conn:
+                conn.execute(f"UPDATE processing_run SET {assignments} WHERE id = ?",
+                             (*fields.values(), run_id))
+        finally:
+            conn.close()
+
+    def _fail_orphans(self):
+        """Jobs left queued, or running with a dead PID, by an earlier
+        server process will never finish; mark them failed."""
+        conn = connect(self.db_path)
+        try:
+            rows = conn.execute(
+                "SELECT id, pid FROM processing_run WHERE status IN (?, ?)",
+                (QUEUED, RUNNING)).fetchall()
+            orphans = [(FAILED, run_id) for run_id, pid in rows
+                       if pid is None or not _pid_alive(pid)]
+            with conn:
+                conn.executemany("UPDATE processing_run SET status = ? WHERE id = ?", orphans)
+        finally:
+            conn.close()
+
+    def shutdown(self, wait=False):
+        """Stop the workers once the jobs queued so far have run; with wait,
+        block until they have."""
+        for _ in self.threads:
+            self.jobs.put(None)
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+
+def init_app(app):
+    """Create the app's decode queue; FLASK_DECODE_WORKERS overrides the
+    default of one worker per CPU core."""
+    workers = int(app.config.get("DECODE_WORKERS") or os.cpu_count() or 1)
+    queue = DecodeQueue(app.config["DATABASE"], workers)
+    app.extensions["decode_queue"] = queue
+    # On the first request: the debug reloader's watcher process runs
+    # create_app too, and must not fail the serving process's jobs
+    app.before_request(queue.start)
+
+
+def get_decode_queue():
+    from flask import current_app
+    return current_app.extensions["decode_queue"]
@@ -0,0 +1,116 @@
+"""
+Signal Activity Pre-scan
+------------------------
+
+Finds the parts of an IQ capture that have energy near the expected
+(Doppler-shifted) carrier, so the decoder can skip the dead air before AOS,
+after LOS and between transmissions.
+
+The memory-mapped WAV is cut into CHUNK_S chunks.  Each chunk's power
+spectrum is the average of NFFT-point FFTs over all of its samples, computed
+for BATCH_CHUNKS chunks at a time with one numpy FFT call.  A chunk is active
+when the strongest bin in the band around the expected carrier is
+THRESHOLD_DB above the chunk's median bin power (the noise floor).  Averaging
+a few hundred FFTs per chunk keeps noise bins within about 1 dB of the
+floor, so a small threshold does not trigger on noise.  Active chunks are
+widened by MARGIN_S on each side and merged into frame ranges.
+
+Used by passdata_headless.py --active-only, which plays only those ranges.
+"""
+
+import numpy as np
+
+CHUNK_S = 0.5
+NFFT = 256
+BATCH_CHUNKS = 16
+THRESHOLD_DB = 3.0
+MARGIN_S = 2.0
+# Searched either side of the carrier when there is no Doppler curve:
+# the worst-case LEO Doppler shift at 437 MHz
+MAX_DOPPLER_HZ = 11000.0
+
+
+def chunk_activity(frames, sample_rate, carrier_hz, half_width_hz,
+                   chunk_s=CHUNK_S, nfft=NFFT, threshold_db=THRESHOLD_DB):
+    """
+    One boolean per chunk: is there energy within half_width_hz of the
+    carrier?
+
+    Args:
+        frames: (n, 2) int32 I/Q array, typically a np.memmap of the WAV data.
+        sample_rate (int): Sample rate of frames.
+        carrier_hz (callable): Maps chunk mid times (s, array) to the expected
+            carrier frequency (Hz, array) relative to the capture center.
+        half_width_hz (float): Half width of the searched band.
+
+    Returns:
+        (active, chunk_frames): boolean array, and the chunk length in frames.
+    """
+    per_chunk = max(1, int(chunk_s * sample_rate) // nfft)
+    chunk_frames = per_chunk * nfft
+    n_chunks = len(frames) // chunk_frames
+    freqs = np.fft.fftfreq(nfft, 1.0 / sample_rate)
+    window = np.hanning(nfft).astype(np.float32)
+    active = np.zeros(n_chunks, dtype=bool)
+
+    for first in range(0, n_chunks, BATCH_CHUNKS):
+        m = min(BATCH_CHUNKS, n_chunks - first)
+        iq = np.asarray(frames[first * chunk_frames:(first + m) * chunk_frames], dtype=np.float32)
+        x = np.empty(len(iq), dtype=np.complex64)
+        x.real = iq[:, 0]
+        x.imag = iq[:, 1]
+        x = x.reshape(m, per_chunk, nfft) * window
+        psd = (np.abs(np.fft.fft(x, axis=2)) ** 2).mean(axis=1)  # (m, nfft)
+
+        mid_s = (first + np.arange(m) + 0.5) * chunk_frames / sample_rate
+        in_band = np.abs(freqs[None, :] - np.asarray(carrier_hz(mid_s))[:, None]) <= half_width_hz
+        band = np.where(in_band, psd, 0.0).max(axis=1)
+        floor = np.median(psd, axis=1)
+        active[first:first + m] = band > floor * 10.0 ** (threshold_db / 10.0)
+
+    return active, chunk_frames
+
+
+def active_ranges(active, chunk_frames, n_frames, margin_frames):
+    """Merge active chunks, each widened by margin_frames, into sorted
+    [start, stop) frame ranges within [0, n_frames)."""
+    idx = np.flatnonzero(active)
+    if len(idx) == 0:
+        return []
+    # runs of consecutive active chunks
+    breaks = np.flatnonzero(np.diff(idx) > 1)
+    run_first = idx[np.r_[0, breaks + 1]]
+    run_last = idx[np.r_[breaks, len(idx) - 1]]
+
+    ranges = []
+    for a, b in zip(run_first * chunk_frames - margin_frames,
+                    (run_last + 1) * chunk_frames + margin_frames):
+        a, b = max(0, int(a)), min(n_frames, int(b))
+        if ranges and a <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], b)
+        else:
+            ranges.append([a, b])
+    return [tuple(r) for r in ranges]
+
+
+def scan_capture(frames, sample_rate, center_diff=None, frequency_offset=0.0,
+                 chan_bw=14400.0, margin_s=MARGIN_S, threshold_db=THRESHOLD_DB):
+    """
+    Frame ranges of the capture worth decoding.
+
+    center_diff(t) gives the Doppler center difference (Hz) at t seconds, as
+    from the playback block's Doppler table; without it the band covers
+    +/- MAX_DOPPLER_HZ.  frequency_offset is the decoder's frequency offset:
+    the signal sits at center_diff - frequency_offset in the raw capture.
+    Returns [] if no chunk is active.
+    """
+    if center_diff is not None:
+        carrier_hz = lambda t: center_diff(t) - frequency_offset
+        half_width_hz = chan_bw / 2
+    else:
+        carrier_hz = lambda t: np.full(len(t), -float(frequency_offset))
+        half_width_hz = chan_bw / 2 + MAX_DOPPLER_HZ
+
+    active, chunk_frames = chunk_activity(frames, sample_rate, carrier_hz, half_width_hz,
+                                          threshold_db=threshold_db)
+    return active_ranges(active, chunk_frames, len(frames), int(margin_s * sample_rate))
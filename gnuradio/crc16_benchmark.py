@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the IL2P decoder's CRC-16/X.25 (AX.25 FCS).
+
+Compares the original bit-by-bit FCS over ax25_header + payload with the
+table-driven version that starts from the precomputed header state.
+
+Run from the gnuradio directory (SILVERSAT_ROOT must be set, as for playback):
+    python3 crc16_benchmark.py
+"""
+
+import os
+import timeit
+
+import passdata_playback_epy_block_4 as il2p
+
+
+AX25_HEADER = bytes([
+    0xAE,0xA0,0x64,0xB0,0x8E,0xAE,0x00,0xAE,
+    0xA0,0x64,0xB0,0x8E,0xAE,0x01,0x03,0xF0
+])
+
+
+def crc16_x25_bitwise(data):
+    crc = 0xFFFF
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0x8408
+            else:
+                crc >>= 1
+    return crc ^ 0xFFFF
+
+
+def main(payload_len=195, number=2000):
+    # Standard check value for CRC-16/X.25
+    assert il2p.crc16_x25(b"123456789") == 0x906E
+
+    payload = os.urandom(payload_len)
+    header_state = il2p.crc16_x25_update(il2p.CRC16_X25_INIT, AX25_HEADER)
+
+    def before():
+        return crc16_x25_bitwise(AX25_HEADER + payload)
+
+    def after():
+        return il2p.crc16_x25_final(il2p.crc16_x25_update(header_state, payload))
+
+    assert before() == after()
+
+    t_before = min(timeit.repeat(before, number=number, repeat=5)) / number
+    t_after = min(timeit.repeat(after, number=number, repeat=5)) / number
+
+    print(f"payload {payload_len} bytes + {len(AX25_HEADER)} byte AX.25 header")
+    print(f"  bitwise:        {t_before * 1e6:8.1f} us/frame")
+    print(f"  table + header: {t_after * 1e6:8.1f} us/frame")
+    print(f"  speedup:        {t_before / t_after:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
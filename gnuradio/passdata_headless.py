@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Headless offline decoder for passdata_playback
+# Author: Tom Conrad
+#
+# Same DSP chain as passdata_playback.grc (source -> frequency offset ->
+# channel filter -> squelch -> quad demod -> gaussian -> symbol sync ->
+# slicer -> access code -> framer -> IL2P decoder), but with no Qt GUI
+# sinks and no throttle, so a recorded WAV is decoded as fast as the CPU
+# allows.  The flowgraph stops by itself at the end of the WAV.
+#
+# Run directly, or through passdata_playback.py --headless.
+#
+# --active-only 1 pre-scans the WAV (activity_scan.py) and decodes only the
+# stretches with energy near the expected carrier, plus a margin.
+#
+# --start-s / --stop-s decode one time segment of the WAV, so a long capture
+# can be split across several processes (see segmented_decode.py).  Packets
+# are stored with the WAV frame they were found at and the --segment index,
+# for de-duplication.
+#
+
+from gnuradio import analog
+import math
+from gnuradio import blocks
+from gnuradio import digital
+from gnuradio import filter
+from gnuradio import eng_notation
+from gnuradio.filter import firdes
+from gnuradio import gr
+from gnuradio.fft import window
+import sys
+import signal
+from argparse import ArgumentParser
+from gnuradio.eng_arg import eng_float, intx
+from math import pi
+import numpy as np
+import os
+import passdata_playback_epy_block_0 as epy_block_0  # embedded python block
+import passdata_playback_epy_block_1 as epy_block_1  # embedded python block
+import passdata_playback_epy_block_4 as epy_block_4  # embedded python block
+import passdata_playback_epy_block_5 as epy_block_5  # embedded python block
+import activity_scan
+
+
+class passdata_headless(gr.top_block):
+
+    def __init__(self, access_threshold=3, active_only=0, capture_session_id=0, doppler_en=0, frequency_offset=0, output_path='received_files/', processing_run_id=0, segment=-1, source_file=os.path.join(os.getenv('SILVERSAT_ROOT'), "captures/20260112_233622.557094.wav"), start_s=0, stop_s=0, store_packets=0):
+        gr.top_block.__init__(self, "Silversat Packet Receiver (headless)", catch_exceptions=True)
+
+        ##################################################
+        # Parameters
+        ##################################################
+        self.access_threshold = access_threshold
+        self.active_only = active_only
+        self.capture_session_id = capture_session_id
+        self.doppler_en = doppler_en
+        self.frequency_offset = frequency_offset
+        self.output_path = output_path
+        self.processing_run_id = processing_run_id
+        self.source_file = source_file
+        self.segment = segment
+        self.start_s = start_s
+        self.stop_s = stop_s
+        self.store_packets = store_packets
+
+        ##################################################
+        # Variables
+        ##################################################
+        self.symbol_rate = symbol_rate = 9600
+        self.samples_per_symbol = samples_per_symbol = 16
+        self.transition = transition = 1000
+        self.tle_file = tle_file = os.path.join(os.getenv('SILVERSAT_ROOT'), 'default.tle')
+        self.squelch = squelch = -60
+        self.samp_rate = samp_rate = symbol_rate*16
+        self.fsk_deviation_hz = fsk_deviation_hz = symbol_rate/2*0.5
+        self.freq = freq = 437175
+        self.decimation = decimation = 1
+        self.chan_bw = chan_bw = (1+0.5)*symbol_rate
+        self.TED_bandwidth = TED_bandwidth = 0.1
+
+        ##################################################
+        # Blocks
+        ##################################################
+
+        # Only the selected source is built, so the WAV is read once.
+        # The playback block can skip to a segment or the active ranges;
+        # wavfile_source can't.
+        partial = bool(start_s or stop_s)
+        if doppler_en or active_only or partial:
+            # Doppler playback tags its Doppler curve for the derotator
+            self.epy_block_0 = epy_block_0.blk(wav_file=source_file, tle_file=tle_file if doppler_en else '', catalog_number='66909U', sat_freq_hz=freq, center_freq_hz=freq, lat=38.9830, lon=-76.4830, elev=2, capture_session_id=capture_session_id, timezone='America/NewYork', debug=False)
+            self._select_ranges(start_s, stop_s, active_only, frequency_offset, chan_bw)
+            if doppler_en:
+                # The derotator only follows the playback block's curve; don't
+                # decode uncorrected when there is none
+                if self.epy_block_0.doppler_t is None:
+                    raise RuntimeError("Doppler correction requested, but no Doppler curve could be "
+                                       "computed for this capture (missing TLE or satellite?)")
+                self.epy_block_5 = epy_block_5.blk(samp_rate=samp_rate, tag_key="doppler_curve")
+        else:
+            self.blocks_wavfile_source_0 = blocks.wavfile_source(source_file, False)
+            self.blocks_float_to_complex_0 = blocks.float_to_complex(1)
+        self.freq_xlating_fir_filter_xxx_0 = filter.freq_xlating_fir_filter_ccc(1, firdes.low_pass(1.0, samp_rate, chan_bw/2, transition, window.WIN_HAMMING), 0, samp_rate)
+        self.fir_filter_xxx_1 = filter.fir_filter_fff(1, firdes.gaussian(1.0, samp_rate/symbol_rate, 0.5, 4*samples_per_symbol))
+        self.fir_filter_xxx_1.declare_sample_delay(0)
+        self.epy_block_4 = epy_block_4.il2p_decoder(lfsr_seed=0x1F0, output_dir="", processing_run_id=processing_run_id, store_packets=store_packets)
+        if segment >= 0:
+            self.epy_block_4.segment = segment
+        self.epy_block_4.sample_offset_of = self.sample_offset_of
+        self.epy_block_1 = epy_block_1.blk(sync_tag="sync", code_len_bits=32)
+        self.digital_symbol_sync_xx_1 = digital.symbol_sync_ff(
+            digital.TED_EARLY_LATE,
+            16,
+            TED_bandwidth,
+            1.0,
+            0.3,
+            1.5,
+            1,
+            digital.constellation_bpsk().base(),
+            digital.IR_MMSE_8TAP,
+            128,
+            [])
+        self.digital_correlate_access_code_tag_xx_0_0 = digital.correlate_access_code_tag_bb('00110011010101010011001101010101', access_threshold, 'sync')
+        self.digital_binary_slicer_fb_0 = digital.binary_slicer_fb()
+        self.blocks_freqshift_cc_0 = blocks.rotator_cc(2.0*math.pi*frequency_offset/samp_rate)
+        self.analog_quadrature_demod_cf_0 = analog.quadrature_demod_cf((samp_rate/decimation/(2*pi*fsk_deviation_hz)))
+        # Not gated: a closed squelch outputs zeros, so no samples (or
+        # wav_frame tags) are dropped between the WAV and the framer
+        self.analog_pwr_squelch_xx_0 = analog.pwr_squelch_cc(squelch, (1e-4), 0, False)
+
+
+        ##################################################
+        # Connections
+        ##################################################
+        if doppler_en:
+            self.connect((self.epy_block_0, 0), (self.epy_block_5, 0))
+            self.connect((self.epy_block_5, 0), (self.blocks_freqshift_cc_0, 0))
+        elif active_only or partial:
+            self.connect((self.epy_block_0, 0), (self.blocks_freqshift_cc_0, 0))
+        else:
+            self.connect((self.blocks_wavfile_source_0, 1), (self.blocks_float_to_complex_0, 1))
+            self.connect((self.blocks_wavfile_source_0, 0), (self.blocks_float_to_complex_0, 0))
+            self.connect((self.blocks_float_to_complex_0, 0), (self.blocks_freqshift_cc_0, 0))
+        self.msg_connect((self.epy_block_1, 'pdus'), (self.epy_block_4, 'pdus'))
+        self.connect((self.blocks_freqshift_cc_0, 0), (self.freq_xlating_fir_filter_xxx_0, 0))
+        self.connect((self.freq_xlating_fir_filter_xxx_0, 0), (self.analog_pwr_squelch_xx_0, 0))
+        self.connect((self.analog_pwr_squelch_xx_0, 0), (self.analog_quadrature_demod_cf_0, 0))
+        self.connect((self.analog_quadrature_demod_cf_0, 0), (self.fir_filter_xxx_1, 0))
+        self.connect((self.fir_filter_xxx_1, 0), (self.digital_symbol_sync_xx_1, 0))
+        self.connect((self.digital_symbol_sync_xx_1, 0), (self.digital_binary_slicer_fb_0, 0))
+        self.connect((self.digital_binary_slicer_fb_0, 0), (self.digital_correlate_access_code_tag_xx_0_0, 0))
+        self.connect((self.digital_correlate_access_code_tag_xx_0_0, 0), (self.epy_block_1, 0))
+
+    def sample_offset_of(self, bit, mark):
+        """
+        WAV frame of the framer's bit `bit`.  Counted on from mark, the last
+        wav_frame tag the playback block put in the stream (bit offset, WAV
+        frame), so symbol sync drift only builds up between two tags;
+        without one, one bit per symbol from the start of playback.
+        """
+        if mark is not None:
+            return mark[1] + (bit - mark[0]) * self.samples_per_symbol
+        if hasattr(self, "epy_block_0"):
+            return self.epy_block_0.file_frame(bit * self.samples_per_symbol)
+        return bit * self.samples_per_symbol
+
+    def _select_ranges(self, start_s, stop_s, active_only, frequency_offset, chan_bw):
+        """Limit playback to the [start_s, stop_s) segment (stop_s 0 = end of
+        file) and, with active_only, to its active parts, searching around
+        the Doppler curve when the playback block has one."""
+        src = self.epy_block_0
+        start = min(len(src.wav), int(start_s * src.sample_rate))
+        stop = int(stop_s * src.sample_rate) if stop_s else len(src.wav)
+        stop = min(len(src.wav), max(start, stop))
+        ranges = [(start, stop)]
+
+        if active_only:
+            center_diff = None
+            if src.doppler_t is not None:
+                center_diff = lambda t: np.interp(t + start / src.sample_rate, src.doppler_t, src.doppler_diff)
+            active = activity_scan.scan_capture(src.wav[start:stop], src.sample_rate, center_diff,
+                                                frequency_offset, chan_bw)
+            total_s = (stop - start) / src.sample_rate
+            if active:
+                ranges = [(start + a, start + b) for a, b in active]
+                active_s = sum(b - a for a, b in ranges) / src.sample_rate
+                print(f"[headless] decoding {active_s:.0f} of {total_s:.0f} s in {len(ranges)} range(s)")
+            else:
+                print(f"[headless] no activity found, decoding all {total_s:.0f} s")
+
+        src.set_play_ranges(ranges)
+
+
+def argument_parser():
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--access-threshold", dest="access_threshold", type=intx, default=3,
+        help="Set access_threshold [default=%(default)r]")
+    parser.add_argument(
+        "--active-only", dest="active_only", type=intx, default=0,
+        help="Set active_only [default=%(default)r]")
+    parser.add_argument(
+        "--capture-session-id", dest="capture_session_id", type=intx, default=0,
+        help="Set capture_session_id [default=%(default)r]")
+    parser.add_argument(
+        "--doppler-en", dest="doppler_en", type=intx, default=0,
+        help="Set doppler_en [default=%(default)r]")
+    parser.add_argument(
+        "--frequency-offset", dest="frequency_offset", type=eng_float, default=eng_notation.num_to_str(float(0)),
+        help="Set frequency_offset [default=%(default)r]")
+    parser.add_argument(
+        "--output-path", dest="output_path", type=str, default='received_files/',
+        help="Set output_path [default=%(default)r]")
+    parser.add_argument(
+        "--processing-run-id", dest="processing_run_id", type=intx, default=0,
+        help="Set processing_run_id [default=%(default)r]")
+    parser.add_argument(
+        "--source-file", dest="source_file", type=str, default=os.path.join(os.getenv('SILVERSAT_ROOT'), "captures/20260112_233622.557094.wav"),
+        help="Set source_file [default=%(default)r]")
+    parser.add_argument(
+        "--segment", dest="segment", type=intx, default=-1,
+        help="Set segment [default=%(default)r]")
+    parser.add_argument(
+        "--start-s", dest="start_s", type=eng_float, default=0,
+        help="Set start_s [default=%(default)r]")
+    parser.add_argument(
+        "--stop-s", dest="stop_s", type=eng_float, default=0,
+        help="Set stop_s [default=%(default)r]")
+    parser.add_argument(
+        "--store-packets", dest="store_packets", type=intx, default=0,
+        help="Set store_packets [default=%(default)r]")
+    return parser
+
+
+def main(top_block_cls=passdata_headless, options=None):
+    """
+    Decode the WAV to the end and return a process exit status:
+    0 = WAV fully processed, 1 = the flowgraph could not be built or run.
+    """
+    if options is None:
+        options = argument_parser().parse_args()
+
+    if not os.path.isfile(options.source_file):
+        print(f"[headless] source file not found: {options.source_file}", file=sys.stderr)
+        return 1
+
+    try:
+        tb = top_block_cls(access_threshold=options.access_threshold, active_only=getattr(options, "active_only", 0), capture_session_id=options.capture_session_id, doppler_en=options.doppler_en, frequency_offset=options.frequency_offset, output_path=options.output_path, processing_run_id=options.processing_run_id, segment=getattr(options, "segment", -1), source_file=options.source_file, start_s=getattr(options, "start_s", 0), stop_s=getattr(options, "stop_s", 0), store_packets=options.store_packets)
+    except Exception as e:
+        print(f"[headless] could not build flowgraph: {e}", file=sys.stderr)
+        return 1
+
+    def sig_handler(sig=None, frame=None):
+        tb.stop()
+        tb.wait()
+
+        sys.exit(1)
+
+    signal.signal(signal.SIGINT, sig_handler)
+    signal.signal(signal.SIGTERM, sig_handler)
+
+    tb.start()
+    tb.wait()
+    # wait() returns once the source hits end of file; stop() lets the
+    # decoder flush its buffered packets.
+    tb.stop()
+    tb.wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
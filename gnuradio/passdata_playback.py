@@ -34,6 +34,7 @@ import passdata_playback_epy_block_0 as epy_block_0  # embedded python block
 import passdata_playback_epy_block_1 as epy_block_1  # embedded python block
 import passdata_playback_epy_block_2 as epy_block_2  # embedded python block
 import passdata_playback_epy_block_4 as epy_block_4  # embedded python block
+import passdata_playback_epy_block_5 as epy_block_5  # embedded python block
 import pathlib
 import sip
 import threading
@@ -534,14 +535,18 @@ class passdata_playback(gr.top_block, Qt.QWidget):
         for c in range(1, 2):
             self.tab0_grid_layout_0.setColumnStretch(c, 1)
         self.freq_xlating_fir_filter_xxx_0_0 = filter.freq_xlating_fir_filter_ccc(1, firdes.low_pass(1.0, samp_rate, chan_bw/2, transition, window.WIN_HAMMING), 0, samp_rate)
-        self.freq_xlating_fir_filter_xxx_0 = filter.freq_xlating_fir_filter_ccc(1, firdes.low_pass(1.0, samp_rate, chan_bw/2, transition, window.WIN_HAMMING), center_diff, samp_rate)
+        self.freq_xlating_fir_filter_xxx_0 = filter.freq_xlating_fir_filter_ccc(1, firdes.low_pass(1.0, samp_rate, chan_bw/2, transition, window.WIN_HAMMING), 0, samp_rate)
         self.fir_filter_xxx_1 = filter.fir_filter_fff(1, firdes.gaussian(1.0, samp_rate/symbol_rate, 0.5, 4*samples_per_symbol))
         self.fir_filter_xxx_1.declare_sample_delay(0)
         self.fir_filter_xxx_0 = filter.fir_filter_fff(100, firdes.low_pass(1.0, samp_rate, samp_rate/4, transition, window.WIN_HAMMING))
         self.fir_filter_xxx_0.declare_sample_delay(0)
+        self.epy_block_5 = epy_block_5.blk(samp_rate=samp_rate, tag_key="doppler_curve")
         self.epy_block_4 = epy_block_4.il2p_decoder(lfsr_seed=0x1F0, output_dir="", processing_run_id=processing_run_id, store_packets=store_packets)
         self.epy_block_1 = epy_block_1.blk(sync_tag="sync", code_len_bits=32)
         self.epy_block_0 = epy_block_0.blk(wav_file=source_file, tle_file=tle_file, catalog_number='66909U', sat_freq_hz=freq, center_freq_hz=freq, lat=38.9830, lon=-76.4830, elev=2, capture_session_id=capture_session_id, timezone='America/NewYork', debug=True)
+        if doppler_en and self.epy_block_0.doppler_t is None:
+            raise RuntimeError("Doppler correction requested, but no Doppler curve could be "
+                               "computed for this capture (missing TLE or satellite?)")
         self.digital_symbol_sync_xx_1 = digital.symbol_sync_ff(
             digital.TED_EARLY_LATE,
             16,
@@ -576,7 +581,6 @@ class passdata_playback(gr.top_block, Qt.QWidget):
         # Connections
         ##################################################
         self.msg_connect((self.epy_block_0, 'freq'), (self.blocks_msgpair_to_var_0, 'inpair'))
-        self.msg_connect((self.epy_block_0, 'freq'), (self.freq_xlating_fir_filter_xxx_0, 'freq'))
         self.msg_connect((self.epy_block_1, 'pdus'), (self.epy_block_4, 'pdus'))
         self.msg_connect((self.epy_block_4, 'out'), (self.blocks_message_debug_0_0_0, 'log'))
         self.connect((self.analog_pwr_squelch_xx_0, 0), (self.analog_quadrature_demod_cf_0, 0))
@@ -602,7 +606,8 @@ class passdata_playback(gr.top_block, Qt.QWidget):
         self.connect((self.digital_symbol_sync_xx_1, 0), (self.qtgui_eye_sink_x_0, 0))
         self.connect((self.digital_symbol_sync_xx_1, 0), (self.qtgui_time_sink_x_1_0_0, 0))
         self.connect((self.digital_symbol_sync_xx_1, 1), (self.qtgui_time_sink_x_1_0_0, 1))
-        self.connect((self.epy_block_0, 0), (self.blocks_selector_0_0, 1))
+        self.connect((self.epy_block_0, 0), (self.epy_block_5, 0))
+        self.connect((self.epy_block_5, 0), (self.blocks_selector_0_0, 1))
         self.connect((self.fir_filter_xxx_0, 0), (self.qtgui_time_sink_x_0_1, 0))
         self.connect((self.fir_filter_xxx_1, 0), (self.digital_symbol_sync_xx_1, 0))
         self.connect((self.fir_filter_xxx_1, 0), (self.qtgui_time_sink_x_0_0, 0))
@@ -735,6 +740,7 @@ class passdata_playback(gr.top_block, Qt.QWidget):
         self.analog_quadrature_demod_cf_0.set_gain((self.samp_rate/self.decimation/(2*pi*self.fsk_deviation_hz)))
         self.blocks_freqshift_cc_0.set_phase_inc(2.0*math.pi*self.frequency_offset/self.samp_rate)
         self.blocks_throttle2_0.set_sample_rate(self.samp_rate)
+        self.epy_block_5.samp_rate = self.samp_rate
         self.fir_filter_xxx_0.set_taps(firdes.low_pass(1.0, self.samp_rate, self.samp_rate/4, self.transition, window.WIN_HAMMING))
         self.fir_filter_xxx_1.set_taps(firdes.gaussian(1.0, self.samp_rate/self.symbol_rate, 0.5, 4*self.samples_per_symbol))
         self.freq_xlating_fir_filter_xxx_0.set_taps(firdes.low_pass(1.0, self.samp_rate, self.chan_bw/2, self.transition, window.WIN_HAMMING))
@@ -786,7 +792,6 @@ class passdata_playback(gr.top_block, Qt.QWidget):
     def set_center_diff(self, center_diff):
         self.center_diff = center_diff
         Qt.QMetaObject.invokeMethod(self._center_diff_label, "setText", Qt.Q_ARG("QString", str(self._center_diff_formatter(self.center_diff))))
-        self.freq_xlating_fir_filter_xxx_0.set_center_freq(self.center_diff)
 
     def get_TED_bandwidth(self):
         return self.TED_bandwidth
@@ -823,6 +828,10 @@ def argument_parser():
     parser.add_argument(
         "--store-packets", dest="store_packets", type=intx, default=0,
         help="Set store_packets [default=%(default)r]")
+    # not a GRC parameter: re-add after regenerating from passdata_playback.grc
+    parser.add_argument(
+        "--headless", dest="headless", action="store_true",
+        help="Decode without the Qt GUI or throttle and exit at end of file (see passdata_headless.py)")
     return parser
 
 
@@ -830,6 +839,10 @@ def main(top_block_cls=passdata_playback, options=None):
     if options is None:
         options = argument_parser().parse_args()
 
+    if getattr(options, "headless", False):
+        import passdata_headless
+        sys.exit(passdata_headless.main(options=options))
+
     qapp = Qt.QApplication(sys.argv)
 
     tb = top_block_cls(access_threshold=options.access_threshold, capture_session_id=options.capture_session_id, doppler_en=options.doppler_en, frequency_offset=options.frequency_offset, output_path=options.output_path, processing_run_id=options.processing_run_id, source_file=options.source_file, store_packets=options.store_packets)
@@ -7,6 +7,10 @@ and computes the Doppler-shifted satellite frequency difference relative to the
 center frequency. It publishes the difference in sync with the playback once per second
 via a message port.
 
+The Doppler curve for the whole capture is computed up front with Skyfield and
+cached next to the WAV as <wav>.doppler.npz, so reprocessing the same capture
+skips orbit propagation.  Values between table points are interpolated.
+
 Requirements:
     - Input WAV file must be stereo (2 channels).
     - Left channel = I (in-phase) samples.
@@ -23,6 +27,14 @@ Outputs:
 Message Ports:
     "freq" → publishes center frequency difference (Hz)
 
+Stream Tags:
+    "doppler_curve" on the first sample → (t, center_diff) f64vectors for the
+    Doppler Derotator block
+
+set_play_ranges() limits playback to a list of frame ranges (the active parts
+found by activity_scan.py).  The Doppler curve is tagged again at the start of
+each range, shifted so that t = 0 is the range's first sample.
+
 Author: Douglas C. Papay <k8dp.doug@gmail.com>
 License: GPLv3
 
@@ -35,7 +47,6 @@ which is a table in the database that holds the setup parameters
 import numpy as np
 import ephem
 import datetime
-import wave
 import re
 import pmt
 from gnuradio import gr
@@ -48,6 +59,11 @@ import os
 _PROJECT_ROOT = os.getcwd()
 #_PROJECT_ROOT = os.path.abspath(os.path.join(_THIS_DIR, ".."))
 DB_PATH = os.path.join(_PROJECT_ROOT, "observations.db")
+# capture_metadata lives in the project root, wherever this is run from
+_SILVERSAT_ROOT = os.getenv('SILVERSAT_ROOT')
+if _SILVERSAT_ROOT not in sys.path:
+    sys.path.insert(0, _SILVERSAT_ROOT)
+from capture_metadata import read_wav_header
 
 try:
     conn = sqlite3.connect(DB_PATH) 
@@ -60,6 +76,55 @@ except Exception as e:
 
 
 C = 299792458.0  # speed of light in m/s
+IQ_SCALE = 1.0 / 2147483648.0  # int32 full scale -> +/-1.0
+DOPPLER_STEP_S = 1.0  # Doppler table resolution; values in between are interpolated
+
+
+def map_wav_iq(path):
+    """
+    Memory-map the data chunk of a 32-bit PCM WAV file.
+
+    The RIFF chunks are walked by capture_metadata.read_wav_header, the
+    parser the web app uses.  Returns (frames, sample_rate, channels), where
+    frames is a read-only int32 array of shape (n_frames, channels) backed
+    by the file.
+    """
+    header = read_wav_header(path)
+    if header["bits"] != 32:
+        raise ValueError(f"{path} must be 32-bit PCM, but has {header['bits']} bits per sample")
+
+    frames = np.memmap(path, dtype='<i4', mode='r', offset=header["data_offset"],
+                       shape=(header["frames"], header["channels"]))
+    return frames, header["sample_rate"], header["channels"]
+
+
+def doppler_table(line1, line2, lat, lon, elev, start_utc, duration_s,
+                  sat_freq_hz, center_freq_hz, step_s=DOPPLER_STEP_S):
+    """
+    Compute the center difference (Hz) over a whole capture in one
+    vectorized Skyfield call.
+
+    start_utc is a naive UTC datetime.  Returns (t, center_diff): seconds
+    from the start of the capture and the Doppler-shifted satellite
+    frequency minus the SDR center frequency at each t.
+    """
+    from skyfield.api import load, EarthSatellite, wgs84
+
+    ts = load.timescale()
+    satellite = EarthSatellite(line1, line2, 'SAT', ts)
+    observer = wgs84.latlon(lat, lon, elevation_m=elev)
+
+    t = np.arange(0.0, duration_s + step_s, step_s)
+    times = ts.utc(start_utc.year, start_utc.month, start_utc.day,
+                   start_utc.hour, start_utc.minute,
+                   start_utc.second + start_utc.microsecond / 1e6 + t)
+    topocentric = (satellite - observer).at(times)
+    range_rate = topocentric.frame_latlon_and_rates(observer)[5]
+    rel_vel = range_rate.km_per_s * 1000.0
+
+    center_diff = sat_freq_hz * (1 - rel_vel / C) - center_freq_hz
+    return t, center_diff
+
 
 class blk(gr.sync_block):
     """
@@ -129,6 +194,7 @@ class blk(gr.sync_block):
             self.sat_freq_hz = sat_freq_hz
             self.center_freq_hz = center_freq_hz
             self.sat = None
+            self.tle_lines = None
             
             if capture_session_id:
                 try: 
@@ -179,6 +245,7 @@ class blk(gr.sync_block):
 
                         if int(catnum_digits) == int(self.catalog_number):
                             self.sat = ephem.readtle(name, line1, line2)
+                            self.tle_lines = (line1, line2)
                             if self.debug:
                                 print(f"[DEBUG] Loaded satellite {name} with catalog {catnum_digits}")
                                 print("[DEBUG] Line1:", line1)
@@ -202,15 +269,14 @@ class blk(gr.sync_block):
                 self.timezone = timezone
                 self.debug = debug
 
-            # Open WAV (only if provided)
+            # Memory-map WAV (only if provided)
             self.wav = None
+            self.frame_pos = 0
             self.channels = 1
             self.sample_rate = 1
             if self.wav_file:
-                self.wav = wave.open(self.wav_file, 'rb')
-                self.channels = self.wav.getnchannels()
-                self.sample_rate = self.wav.getframerate()
-                print(f'wav file framerate: {self.wav.getframerate()}')
+                self.wav, self.sample_rate, self.channels = map_wav_iq(self.wav_file)
+                print(f'wav file framerate: {self.sample_rate}')
 
                 # Require stereo WAV file
                 if self.channels != 2:
@@ -251,6 +317,7 @@ class blk(gr.sync_block):
 
                             if catnum_digits == self.catalog_number:
                                 self.sat = ephem.readtle(name, line1, line2)
+                                self.tle_lines = (line1, line2)
                                 if self.debug:
                                     print(f"[DEBUG] Loaded satellite {name} with catalog {catnum_digits}")
                                     print("[DEBUG] Line1:", line1)
@@ -281,6 +348,26 @@ class blk(gr.sync_block):
                         if self.debug:
                             print("[DEBUG] Failed to parse start time, using UTC fallback")
 
+            # Doppler curve for the whole capture.  The derotator only follows
+            # this curve, so if Skyfield fails it is built with ephem instead;
+            # None means no Doppler correction is possible
+            self.doppler_t = None
+            self.doppler_diff = None
+            if self.sat is not None and self.wav is not None:
+                try:
+                    self._load_doppler_table()
+                except Exception as e:
+                    print(f"[doppler] table error, computing with ephem: {e}")
+                    try:
+                        self._ephem_doppler_table()
+                    except Exception as e:
+                        print(f"[doppler] ephem error, no Doppler curve: {e}")
+
+            # Frame ranges to play, in order; the whole file by default
+            self.ranges = [(0, len(self.wav))] if self.wav is not None else []
+            self.range_idx = 0
+            self.curve_pending = True  # tag the curve at the next sample
+
             # Local variables
             self.sample_counter = 0
             self.next_update = 0
@@ -288,12 +375,113 @@ class blk(gr.sync_block):
         print('[DEBUG] Init Exception:', e)
         raise
 
+    def _load_doppler_table(self):
+        """
+        Load the capture's Doppler table from the cache file next to the WAV,
+        or compute it for the whole capture and write the cache.
+        """
+        start_utc = self.start_play
+        if start_utc.tzinfo is not None:
+            start_utc = start_utc.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        duration_s = len(self.wav) / self.sample_rate
+        line1, line2 = self.tle_lines
+
+        key = "|".join(str(v) for v in (
+            line1, line2, self.lat, self.lon, self.elev, self.sat_freq_hz,
+            self.center_freq_hz, start_utc.isoformat(), duration_s, DOPPLER_STEP_S))
+        cache_file = self.wav_file + ".doppler.npz"
+
+        try:
+            with np.load(cache_file) as cached:
+                if str(cached["key"]) == key:
+                    self.doppler_t = cached["t"]
+                    self.doppler_diff = cached["center_diff"]
+                    if self.debug:
+                        print(f"[DEBUG] Loaded Doppler table from {cache_file}")
+                    return
+        except Exception as e:
+            # missing, stale or unreadable: compute it again
+            if self.debug and os.path.exists(cache_file):
+                print(f"[DEBUG] Ignoring Doppler cache {cache_file}: {e}")
+
+        self.doppler_t, self.doppler_diff = doppler_table(
+            line1, line2, float(self.lat), float(self.lon), float(self.elev),
+            start_utc, duration_s, self.sat_freq_hz, self.center_freq_hz)
+        # Sweeps and segmented decodes start several processes on the same
+        # capture at once: write to a temporary file and rename it into
+        # place, so no reader ever sees half a cache file
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, "wb") as f:
+                np.savez(f, key=np.array(key), t=self.doppler_t,
+                         center_diff=self.doppler_diff)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            print(f"[doppler] could not write {cache_file}: {e}")
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+        if self.debug:
+            print(f"[DEBUG] Computed Doppler table: {len(self.doppler_t)} points")
+
+    def _ephem_doppler_table(self):
+        """
+        The Doppler table computed point by point with ephem, for when the
+        Skyfield table can't be built.  Not cached.
+        """
+        duration_s = len(self.wav) / self.sample_rate
+        t = np.arange(0.0, duration_s + DOPPLER_STEP_S, DOPPLER_STEP_S)
+        self.doppler_diff = np.array([self._ephem_center_diff(s) for s in t])
+        self.doppler_t = t
+        if self.debug:
+            print(f"[DEBUG] Computed Doppler table with ephem: {len(t)} points")
+
+    def _ephem_center_diff(self, elapsed_s):
+        current_dt = self.start_play + datetime.timedelta(seconds=elapsed_s)
+        self.observer.date = current_dt
+        self.sat.compute(self.observer)
+        rel_vel = self.sat.range_velocity
+        return self.sat_freq_hz * (1 - rel_vel / C) - self.center_freq_hz
+
+    def set_play_ranges(self, ranges):
+        """
+        Play only the [start, stop) frame ranges given, in order, instead of
+        the whole file.  Call before the flowgraph starts.  An empty list
+        keeps the whole file.
+        """
+        ranges = [(int(a), int(b)) for a, b in ranges if b > a]
+        if self.wav is None:
+            return
+        self.ranges = ranges or [(0, len(self.wav))]
+        self.range_idx = 0
+        self.frame_pos = self.ranges[0][0]
+        self.curve_pending = True
+
+    def file_frame(self, stream_pos):
+        """
+        WAV frame that was played as output sample stream_pos.
+        """
+        for a, b in self.ranges:
+            if stream_pos < b - a:
+                return a + stream_pos
+            stream_pos -= b - a
+        return self.ranges[-1][1] + stream_pos if self.ranges else stream_pos
+
+    def center_diff_at(self, elapsed_s):
+        """
+        Center difference (Hz) at elapsed_s seconds into the capture.
+        """
+        if self.doppler_t is not None:
+            return float(np.interp(elapsed_s, self.doppler_t, self.doppler_diff))
+        return self._ephem_center_diff(elapsed_s)
+
     def work(self, input_items, output_items):
         """
         Process audio samples and compute frequency difference.
 
-        Reads frames from the stereo WAV file, outputs complex IQ stream,
-        and once per second computes the Doppler-shifted satellite frequency
+        Copies frames from the memory-mapped stereo WAV file into the
+        complex IQ output stream, and once per second computes the Doppler-shifted satellite frequency
         relative to the SDR center frequency. Publishes the difference via
         the "freq" message port.
 
@@ -309,51 +497,58 @@ class blk(gr.sync_block):
 
         # Audio playback
         if self.wav is not None:
-            frames = self.wav.readframes(n)
-            
-            if not frames:
+            # Move on to the next range once this one is played out
+            while (self.range_idx < len(self.ranges) and
+                   self.frame_pos >= self.ranges[self.range_idx][1]):
+                self.range_idx += 1
+                if self.range_idx < len(self.ranges):
+                    self.frame_pos = self.ranges[self.range_idx][0]
+                    self.curve_pending = True
+            if self.range_idx >= len(self.ranges):
                 out[:] = 0.0 + 0.0j
                 return -1
-            data = np.frombuffer(frames, dtype=np.int32) #.astype(np.float32)
-
-            # Stereo IQ required
-            stereo = data.reshape(-1, 2)
-            i_data = stereo[:, 0] / 2147483648.0
-            q_data = stereo[:, 1] / 2147483648.0
-            #i_data = stereo[:, 0]
-            #q_data = stereo[:, 1]
-            
-            iq = i_data[:n] + 1j * q_data[:n]
-            if len(iq) < n:
-                iq = np.pad(iq, (0, n - len(iq)), constant_values=0)
-            out[:] = iq
+
+            k = min(n, self.ranges[self.range_idx][1] - self.frame_pos)
+            first_s = self.frame_pos / self.sample_rate  # file time of out[0]
+
+            # Stereo IQ required: int32 (I, Q) pairs are scaled straight into
+            # the complex64 output viewed as float32 pairs
+            frames = self.wav[self.frame_pos:self.frame_pos + k]
+            np.multiply(frames, IQ_SCALE, out=out[:k].view(np.float32).reshape(k, 2),
+                        dtype=np.float32, casting='unsafe')
+            # Mark where in the WAV this output starts; the tag travels with
+            # the samples down to the framer, which places packets from it
+            self.add_item_tag(0, self.nitems_written(0), pmt.intern("wav_frame"),
+                              pmt.from_uint64(int(self.frame_pos)))
+            self.frame_pos += k
+            n = k
         else:
             out[:] = 0.0 + 0.0j
             print("out error")
         
         
+        # Hand the whole Doppler curve to the derotator with the first sample
+        # of each range, timed from that sample
+        if self.curve_pending and self.doppler_t is not None:
+            curve_t = self.doppler_t - first_s
+            self.add_item_tag(
+                0, self.nitems_written(0), pmt.intern("doppler_curve"),
+                pmt.cons(pmt.init_f64vector(len(curve_t), curve_t.tolist()),
+                         pmt.init_f64vector(len(self.doppler_diff), self.doppler_diff.tolist()))
+            )
+        self.curve_pending = False
+
         # Advance sample counter
         self.sample_counter += n
 
         # Center difference calculation once per second
         if self.sat is not None and self.sat_freq_hz > 0.0 and self.center_freq_hz > 0.0:
             if self.sample_counter >= self.next_update:
-                current_dt = self.start_play + datetime.timedelta(
-                    seconds=self.sample_counter / self.sample_rate
-                )
-                self.observer.date = current_dt
-                self.sat.compute(self.observer)
-                rel_vel = self.sat.range_velocity
-
-                # Doppler-shifted satellite frequency
-                sat_doppler_freq = self.sat_freq_hz * (1 - rel_vel / C)
-
-                # Difference to SDR center
-                center_diff = sat_doppler_freq - self.center_freq_hz
+                elapsed_s = self.frame_pos / self.sample_rate
+                center_diff = self.center_diff_at(elapsed_s)
 
                 if self.debug:
-                    print(f"[DEBUG] Time: {current_dt}, RelVel: {rel_vel:.2f} m/s, "
-                          f"SatFreq+Doppler: {sat_doppler_freq:.2f} Hz, "
+                    print(f"[DEBUG] Elapsed: {elapsed_s:.1f} s, "
                           f"CenterDiff: {center_diff:.2f} Hz")
 
                 # Publish only the center difference value via "freq" port
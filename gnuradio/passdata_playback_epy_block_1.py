@@ -14,7 +14,11 @@ class blk(gr.basic_block):
         Correlate Access Code - Tag.
 
     Output:
-      - PDUs (u8vector) containing [EXTRA, PAYLOAD ...] only.
+      - PDUs (u8vector) containing [EXTRA, PAYLOAD ...] only, with the
+        absolute bit offset of the sync end as 'bit_offset' in the metadata.
+        When the stream carries 'wav_frame' tags (from the playback block),
+        the last one at or before the sync end goes along as 'frame_mark',
+        a pair (bit offset of the tag, WAV frame).
       - No meaningful stream output (out_sig = []).
     """
 
@@ -29,16 +33,61 @@ class blk(gr.basic_block):
         self.sync_tag = pmt.intern(sync_tag)
         self.code_len_bits = int(code_len_bits)
 
-        # Rolling bit buffer and its starting absolute bit index
-        self.bit_buffer = []            # list of 0/1
-        self.buffer_start_abs = 0       # absolute offset of bit_buffer[0]
+        # Ring buffer of bits (uint8 0/1) indexed by absolute bit offset:
+        # bit at absolute offset a lives at bit_buffer[a % capacity].
+        # Valid bits are [buffer_start_abs, buffer_end_abs).
+        self.bit_buffer = np.zeros(1 << 16, dtype=np.uint8)  # grows if needed
+        self.buffer_start_abs = 0       # absolute offset of oldest kept bit
+        self.buffer_end_abs = 0         # absolute offset one past newest bit
         self.pending_sync_offsets = []  # absolute bit offsets of sync END bits
+        self.frame_tag = pmt.intern("wav_frame")
+        self.frame_marks = []           # (absolute bit offset, WAV frame) of wav_frame tags
 
         # PDU output
         self.message_port_register_out(pmt.intern("pdus"))
 
         self.initialized = False
 
+    def _buffered_bits(self):
+        return self.buffer_end_abs - self.buffer_start_abs
+
+    def _grow(self, min_capacity):
+        """
+        Reallocate the ring (power-of-two size) keeping the valid bits.
+        """
+        capacity = len(self.bit_buffer)
+        while capacity < min_capacity:
+            capacity *= 2
+        bits = self._read_bits(self.buffer_start_abs, self.buffer_end_abs)
+        self.bit_buffer = np.zeros(capacity, dtype=np.uint8)
+        self._write_bits(self.buffer_start_abs, bits)
+
+    def _write_bits(self, start_abs, bits):
+        capacity = len(self.bit_buffer)
+        pos = start_abs % capacity
+        first = min(len(bits), capacity - pos)
+        self.bit_buffer[pos:pos + first] = bits[:first]
+        self.bit_buffer[:len(bits) - first] = bits[first:]
+
+    def _read_bits(self, start_abs, end_abs):
+        """
+        Return bits [start_abs, end_abs) as a contiguous uint8 array.
+        """
+        capacity = len(self.bit_buffer)
+        pos = start_abs % capacity
+        count = end_abs - start_abs
+        if pos + count <= capacity:
+            return self.bit_buffer[pos:pos + count]
+        return np.concatenate((self.bit_buffer[pos:],
+                               self.bit_buffer[:pos + count - capacity]))
+
+    def _append_bits(self, inp):
+        needed = self._buffered_bits() + len(inp)
+        if needed > len(self.bit_buffer):
+            self._grow(needed)
+        self._write_bits(self.buffer_end_abs, np.bitwise_and(inp, 1))
+        self.buffer_end_abs += len(inp)
+
     def _try_extract_frames(self):
         """
         Try to extract as many complete frames as possible from bit_buffer
@@ -51,21 +100,17 @@ class blk(gr.basic_block):
             # First bit of LEN is at sync_end_abs + 1.
             len_start_abs = sync_end_abs # + 1  # <-- if tag is already after sync, drop '+ 1'
 
-            len_start_rel = len_start_abs - self.buffer_start_abs
-            if len_start_rel < 0:
+            if len_start_abs < self.buffer_start_abs:
                 # This sync refers to bits we've already dropped
                 continue
 
             # Need 8 bits for LEN
-            if len_start_rel + 8 > len(self.bit_buffer):
+            if len_start_abs + 8 > self.buffer_end_abs:
                 new_pending.append(sync_end_abs)
                 continue
 
             # Read LEN (1 byte, MSB-first)
-            length_bits = self.bit_buffer[len_start_rel:len_start_rel+8]
-            length_byte = 0
-            for b in length_bits:
-                length_byte = (length_byte << 1) | int(b)
+            length_byte = int(np.packbits(self._read_bits(len_start_abs, len_start_abs + 8))[0])
 
             if length_byte <= 0:
                 # Invalid length; drop this sync
@@ -73,53 +118,59 @@ class blk(gr.basic_block):
 
             # EXTRA+PAYLOAD is LEN bytes = LEN * 8 bits
             frame_bits_needed = length_byte * 8
-            data_start_rel = len_start_rel + 8      # first bit of EXTRA
-            data_end_rel = data_start_rel + frame_bits_needed
+            data_start_abs = len_start_abs + 8      # first bit of EXTRA
+            data_end_abs = data_start_abs + frame_bits_needed
 
-            if data_end_rel > len(self.bit_buffer):
+            if data_end_abs > self.buffer_end_abs:
                 # Not enough bits yet for full frame
                 new_pending.append(sync_end_abs)
                 continue
 
-            # We have a full frame [EXTRA+PAYLOAD]
-            frame_bits = self.bit_buffer[data_start_rel:data_end_rel]
-
-            # Pack bits into bytes (MSB-first)
-            bytes_out = []
-            for i in range(0, len(frame_bits), 8):
-                byte_bits = frame_bits[i:i+8]
-                val = 0
-                for b in byte_bits:
-                    val = (val << 1) | int(b)
-                bytes_out.append(val)
+            # We have a full frame [EXTRA+PAYLOAD]; pack bits into bytes (MSB-first)
+            frame_bytes = np.packbits(self._read_bits(data_start_abs, data_end_abs))
 
             # Prepend LENGTH byte so PDU = [LEN, EXTRA, PAYLOAD...]
-            bytes_out = [length_byte] + bytes_out
-
-            # Emit PDU: [EXTRA, PAYLOAD...]
-            vec = np.array(bytes_out, dtype=np.uint8)
-            meta = pmt.make_dict()
-            payload = pmt.init_u8vector(len(vec), vec.tolist())
+            bytes_out = [length_byte] + frame_bytes.tolist()
+
+            # Emit PDU: [EXTRA, PAYLOAD...]; bit_offset (of the sync end) lets
+            # the decoder place the frame in the capture
+            meta = pmt.dict_add(pmt.make_dict(), pmt.intern("bit_offset"),
+                                pmt.from_uint64(int(sync_end_abs)))
+            mark = self._frame_mark(sync_end_abs)
+            if mark is not None:
+                meta = pmt.dict_add(meta, pmt.intern("frame_mark"),
+                                    pmt.cons(pmt.from_uint64(mark[0]), pmt.from_uint64(mark[1])))
+            payload = pmt.init_u8vector(len(bytes_out), bytes_out)
             pdu = pmt.cons(meta, payload)
             self.message_port_pub(pmt.intern("pdus"), pdu)
 
-            # Optionally, drop bits up to end of this frame to bound buffer size
-            # and avoid re-processing the same region.
-            drop_abs_until = self.buffer_start_abs + data_end_rel
-            drop_count = drop_abs_until - self.buffer_start_abs
-            if drop_count > 0:
-                self.bit_buffer = self.bit_buffer[drop_count:]
-                self.buffer_start_abs = drop_abs_until
+            # Drop bits up to end of this frame to avoid re-processing the
+            # same region; in the ring this is just moving the start offset.
+            if data_end_abs > self.buffer_start_abs:
+                self.buffer_start_abs = data_end_abs
 
         self.pending_sync_offsets = new_pending
 
         # Additional trimming if no pending syncs (keep a small tail)
-        if not self.pending_sync_offsets and len(self.bit_buffer) > 8 * 1024:
+        if not self.pending_sync_offsets and self._buffered_bits() > 8 * 1024:
             # Keep last 1 KB of bits
-            keep = 8 * 1024
-            drop_count = len(self.bit_buffer) - keep
-            self.bit_buffer = self.bit_buffer[drop_count:]
-            self.buffer_start_abs += drop_count
+            self.buffer_start_abs = self.buffer_end_abs - 8 * 1024
+
+        # Keep the marks still needed for the buffered bits: those inside
+        # the buffer and the last one before it
+        keep = 0
+        while keep + 1 < len(self.frame_marks) and self.frame_marks[keep + 1][0] <= self.buffer_start_abs:
+            keep += 1
+        del self.frame_marks[:keep]
+
+    def _frame_mark(self, offset_abs):
+        """The last (bit offset, WAV frame) mark at or before offset_abs."""
+        mark = None
+        for m in self.frame_marks:
+            if m[0] > offset_abs:
+                break
+            mark = m
+        return mark
 
     def general_work(self, input_items, output_items):
         inp = input_items[0]
@@ -129,13 +180,14 @@ class blk(gr.basic_block):
         if n_in == 0:
             return 0
 
-        # Initialize buffer_start_abs on first call
+        # Initialize absolute offsets on first call
         if not self.initialized:
             self.buffer_start_abs = nread
+            self.buffer_end_abs = nread
             self.initialized = True
 
         # Append bits to buffer
-        self.bit_buffer.extend(int(b) & 1 for b in inp)
+        self._append_bits(inp)
 
         # Collect sync tags in this window
         tags = self.get_tags_in_window(0, 0, n_in)
@@ -144,6 +196,8 @@ class blk(gr.basic_block):
                 # Tag is on LAST bit of sync
                 sync_end_abs = t.offset
                 self.pending_sync_offsets.append(sync_end_abs)
+            elif t.key == self.frame_tag:
+                self.frame_marks.append((int(t.offset), int(pmt.to_uint64(t.value))))
 
         # Try to extract frames
         self._try_extract_frames()
@@ -151,4 +205,3 @@ class blk(gr.basic_block):
         # We have no stream outputs; just consume input
         self.consume_each(n_in)
         return 0
-
@@ -6,6 +6,8 @@ import pmt
 import reedsolo
 from dataclasses import dataclass
 import sqlite3 
+import threading
+import time
 
 
 PROJECT_ROOT = os.getenv('SILVERSAT_ROOT')
@@ -16,6 +18,93 @@ DB_PATH = os.path.join(PROJECT_ROOT, "observations.db")
 print(f"[packet_logger] DB PATH: {DB_PATH}")
 
 
+# ------------------------------------------------------------
+# IL2P scrambler lookup tables
+# ------------------------------------------------------------
+# The descrambler is x^9 + x^4 + 1, self-synchronizing: the LFSR is fed with
+# the scrambled bits, so one byte moves a 9-bit state to a new state.  Both the
+# output byte and the next state are linear in (state, input byte), so the
+# 512 x 256 table is built from the state-only and input-only responses.
+def _lfsr_byte(state, in_byte):
+    out_byte = 0
+    for i in range(8):
+        mask = 0x80 >> i
+        in_bit = 1 if (in_byte & mask) else 0
+
+        out_bit = (in_bit ^ (state & 1)) & 1
+        state = (state >> 1)
+        state ^= (in_bit << 8)
+        state ^= (in_bit << 3)
+        state &= 0x1FF
+
+        if out_bit:
+            out_byte |= mask
+    return out_byte, state
+
+
+def _build_scrambler_tables():
+    """
+    DESCRAMBLE_TABLE[(state << 8) | scrambled] = (next_state << 8) | plain
+    SCRAMBLE_TABLE[(state << 8) | plain] = scrambled
+    """
+    by_state = [_lfsr_byte(s, 0) for s in range(512)]
+    by_byte = [_lfsr_byte(0, b) for b in range(256)]
+
+    descramble = [0] * (512 * 256)
+    scramble = bytearray(512 * 256)
+    for s, (s_out, s_next) in enumerate(by_state):
+        base = s << 8
+        for b, (b_out, b_next) in enumerate(by_byte):
+            plain = s_out ^ b_out
+            descramble[base | b] = ((s_next ^ b_next) << 8) | plain
+            scramble[base | plain] = b
+    return descramble, bytes(scramble)
+
+
+DESCRAMBLE_TABLE, SCRAMBLE_TABLE = _build_scrambler_tables()
+
+
+# ------------------------------------------------------------
+# CRC-16/X.25 (AX.25 FCS) lookup table
+# ------------------------------------------------------------
+# Reflected polynomial 0x8408, init 0xFFFF, final xor 0xFFFF.  binascii.crc_hqx
+# is the non-reflected XMODEM variant, so it cannot be used here.
+def _build_crc16_x25_table():
+    table = []
+    for b in range(256):
+        crc = b
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0x8408
+            else:
+                crc >>= 1
+        table.append(crc)
+    return table
+
+
+CRC16_X25_TABLE = _build_crc16_x25_table()
+CRC16_X25_INIT = 0xFFFF
+
+
+def crc16_x25_update(crc, data):
+    """
+    Feed data into a running CRC-16/X.25 register (no final xor).
+    Start from CRC16_X25_INIT, or from a state saved for a fixed prefix.
+    """
+    table = CRC16_X25_TABLE
+    for b in data:
+        crc = (crc >> 8) ^ table[(crc ^ b) & 0xFF]
+    return crc
+
+
+def crc16_x25_final(crc):
+    return crc ^ 0xFFFF
+
+
+def crc16_x25(data):
+    return crc16_x25_final(crc16_x25_update(CRC16_X25_INIT, data))
+
+
 # this is the generic set of information you would need to construct/deconstruct an IL2P or an AX.25 packet
 @dataclass
 class Il2pPacket:
@@ -35,6 +124,8 @@ class Il2pPacket:
     payload_byte_count: int = 0  # zero by default
     packet_len: int = 0
     packet_index: int = 0
+    sample_offset: int = None  # WAV frame of the frame's sync word, if known
+    segment: int = None  # time segment of a segmented decode, if any
 
 
 def list_to_string_str_only(lst, separator=", "):
@@ -43,38 +134,111 @@ def list_to_string_str_only(lst, separator=", "):
     return separator.join(lst)
 
 
-def store_packet(packet): 
-    try: 
-        conn = sqlite3.connect(DB_PATH) 
-        cur = conn.cursor() 
-        cur.execute(
-            """ INSERT INTO packet (
-                length_bytes,
-                processing_run_id,
-                header_hex,
-                header_parity_hex,
-                payload_hex,
-                payload_parity_hex,
-                crc_hex,
-                header_ok,
-                payload_ok,
-                crc_ok,
-                scrambler_ok,
-                packet_error_type,
-                payload_byte_count, 
-                packet_index
-                ) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) """, 
-                (packet.packet_len, packet.processing_run_id, packet.header, packet.header_parity, 
-                    packet.payload, packet.payload_parity, 
-                    packet.encoded_crc, packet.header_okay, 
-                    packet.payload_okay, packet.crc_success, 
-                    packet.scrambler_okay, list_to_string_str_only(packet.packet_error_type), 
-                    packet.payload_byte_count, packet.packet_index)) 
-        conn.commit() 
-        conn.close() 
-    except Exception as e: 
-        print(f"[packet_logger] DB insert error: {e}") 
+PACKET_INSERT_SQL = """ INSERT INTO packet (
+    length_bytes,
+    processing_run_id,
+    header,
+    header_parity,
+    payload,
+    payload_parity,
+    crc,
+    header_ok,
+    payload_ok,
+    crc_ok,
+    scrambler_ok,
+    packet_error_type,
+    payload_byte_count, 
+    packet_index,
+    sample_offset,
+    segment
+    ) 
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) """
+
+
+def packet_row(packet):
+    # bytes() so every field is stored as a BLOB, whatever buffer type it came in
+    return (packet.packet_len, packet.processing_run_id, bytes(packet.header), bytes(packet.header_parity), 
+            bytes(packet.payload), bytes(packet.payload_parity), 
+            bytes(packet.encoded_crc), packet.header_okay, 
+            packet.payload_okay, packet.crc_success, 
+            packet.scrambler_okay, list_to_string_str_only(packet.packet_error_type), 
+            packet.payload_byte_count, packet.packet_index, packet.sample_offset, packet.segment)
+
+
+class PacketWriter:
+    """
+    Buffered packet sink for one processing run.
+
+    Holds a single connection and writes buffered rows with executemany in one
+    transaction once batch_size rows are queued or flush_interval seconds have
+    passed, and on close().  The run's counters in processing_run
+    (packet_count, good_packets, header_ok_packets, scrambler_ok_packets) are
+    bumped in the same transaction, so pages never have to recount packets.
+    Packets added with store=False only count: no row is written for them.
+    """
+
+    def __init__(self, db_path, batch_size=64, flush_interval=2.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.conn = None
+        self.rows = []
+        self.last_flush = time.monotonic()
+        # add() runs in the message handler thread, close() in the flowgraph's
+        self.lock = threading.Lock()
+
+    def add(self, packet, store=True):
+        with self.lock:
+            self.rows.append((packet_row(packet), store))
+            if (len(self.rows) >= self.batch_size or
+                    time.monotonic() - self.last_flush >= self.flush_interval):
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def _flush(self):
+        self.last_flush = time.monotonic()
+        if not self.rows:
+            return
+        rows, self.rows = self.rows, []
+
+        # per-run totals: run_id -> [packets, crc ok, header ok, scrambler ok]
+        counts = {}
+        for row, _ in rows:
+            c = counts.setdefault(row[1], [0, 0, 0, 0])
+            c[0] += 1
+            c[1] += 1 if row[9] else 0
+            c[2] += 1 if row[7] else 0
+            c[3] += 1 if row[10] else 0
+
+        try:
+            if self.conn is None:
+                # WAL + busy timeout, as the web app's connections use, so
+                # page reads don't block on (or fail against) our inserts
+                self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+                self.conn.execute("PRAGMA journal_mode = WAL")
+                self.conn.execute("PRAGMA synchronous = NORMAL")
+            with self.conn:
+                self.conn.executemany(PACKET_INSERT_SQL, [row for row, store in rows if store])
+                self.conn.executemany(
+                    """ UPDATE processing_run
+                        SET packet_count = COALESCE(packet_count, 0) + ?,
+                            good_packets = COALESCE(good_packets, 0) + ?,
+                            header_ok_packets = COALESCE(header_ok_packets, 0) + ?,
+                            scrambler_ok_packets = COALESCE(scrambler_ok_packets, 0) + ?
+                        WHERE id = ? """,
+                    [(*c, run_id) for run_id, c in counts.items()])
+        except Exception as e: 
+            print(f"[packet_logger] DB insert error ({len(rows)} packets): {e}") 
 
 
 class il2p_decoder(gr.basic_block):
@@ -131,6 +295,8 @@ class il2p_decoder(gr.basic_block):
             0xAE,0xA0,0x64,0xB0,0x8E,0xAE,0x00,0xAE,
             0xA0,0x64,0xB0,0x8E,0xAE,0x01,0x03,0xF0
         ])
+        # CRC register after the fixed header; each frame only adds its payload
+        self.ax25_header_crc = crc16_x25_update(CRC16_X25_INIT, self.ax25_header)
 
         # Output file setup
         self.output_dir = output_dir
@@ -140,7 +306,9 @@ class il2p_decoder(gr.basic_block):
             print(f"[IL2P] Warning: could not create output_dir '{self.output_dir}': {e}")
 
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.output_path = os.path.join(self.output_dir, f"il2p_payloads_{ts}.bin")
+        # runs started in the same second (sweeps) must not share a file
+        run_tag = f"_run{processing_run_id}" if processing_run_id else ""
+        self.output_path = os.path.join(self.output_dir, f"il2p_payloads_{ts}{run_tag}.bin")
         try:
             # Unbuffered append-binary; one file per run
             self.outfile = open(self.output_path, "ab", buffering=0)
@@ -168,63 +336,54 @@ class il2p_decoder(gr.basic_block):
         self.processing_run_id = processing_run_id  # the unique id of this processing run
         self.packet_index = 0  # a incrementing counter for this processing run
         self.store_packets = store_packets  # 1 = store packets to the database
+        self.packet_writer = PacketWriter(DB_PATH)
+        # Maps a PDU's bit_offset and frame_mark (or None) to the WAV frame it
+        # came from; set by passdata_headless, which knows what it plays
+        self.sample_offset_of = None
+        # Index of the time segment this process decodes (segmented_decode.py)
+        self.segment = None
         
 
     # ------------------------------------------------------------
     # Self-synchronizing descrambler
     # ------------------------------------------------------------
-    def _descramble_bits(self, scrambled_bytes):
+    def _descramble(self, scrambled_bytes):
+        """
+        Descramble one byte per table lookup.
+        Returns (plain bytes, LFSR state at the start of each byte).
+        """
         state = self.lfsr_seed
+        table = DESCRAMBLE_TABLE
         out_bytes = bytearray(len(scrambled_bytes))
+        states = [0] * len(scrambled_bytes)
 
-        for b in range(len(scrambled_bytes)):
-            out_byte = 0
-            for i in range(8):
-                mask = 0x80 >> i
-                in_bit = 1 if (scrambled_bytes[b] & mask) else 0
+        for b, in_byte in enumerate(scrambled_bytes):
+            states[b] = state
+            entry = table[(state << 8) | in_byte]
+            out_bytes[b] = entry & 0xFF
+            state = entry >> 8
 
-                out_bit = (in_bit ^ (state & 1)) & 1
-                state = (state >> 1)
-                state ^= (in_bit << 8)
-                state ^= (in_bit << 3)
-                state &= 0x1FF
+        return bytes(out_bytes), states
 
-                if out_bit:
-                    out_byte |= mask
-
-            out_bytes[b] = out_byte
-
-        return bytes(out_bytes)
+    def _descramble_bits(self, scrambled_bytes):
+        return self._descramble(scrambled_bytes)[0]
 
 
     # ------------------------------------------------------------
     # Scrambler state validator
     # ------------------------------------------------------------
-    def _validate_scrambler(self, scrambled, descrambled):
+    def _validate_scrambler(self, scrambled, descrambled, states=None):
         """
         Re-scramble descrambled bytes and compare to original scrambled bytes.
+        states: per-byte LFSR states from _descramble(); recomputed if omitted.
         Returns True if all bytes match.
         """
-        state = self.lfsr_seed
-        for b in range(len(descrambled)):
-            out_byte = 0
-            for i in range(8):
-                mask = 0x80 >> i
-                plain_bit = 1 if (descrambled[b] & mask) else 0
-
-                # Transmit scrambler
-                # scr_bit = plain_bit XOR (state & 1)
-                scr_bit = plain_bit ^ (state & 1)
-
-                # Feedback uses the SCRAMBLED bit (self-synchronizing scrambler)
-                state = (state >> 1)
-                state ^= (scr_bit << 8)
-                state ^= (scr_bit << 3)
-                state &= 0x1FF
-
-                if scr_bit:
-                    out_byte |= mask
+        if states is None:
+            states = self._descramble(scrambled)[1]
 
+        table = SCRAMBLE_TABLE
+        for b in range(len(descrambled)):
+            out_byte = table[(states[b] << 8) | descrambled[b]]
             if out_byte != scrambled[b]:
                 print(f"[IL2P] SCR mismatch at byte {b}: exp={scrambled[b]:02X}, got={out_byte:02X}")
                 return False
@@ -247,15 +406,7 @@ class il2p_decoder(gr.basic_block):
     # CRC-16/X.25 (AX.25 FCS)
     # ------------------------------------------------------------
     def _crc16_x25(self, data):
-        crc = 0xFFFF
-        for b in data:
-            crc ^= b
-            for _ in range(8):
-                if crc & 1:
-                    crc = (crc >> 1) ^ 0x8408
-                else:
-                    crc >>= 1
-        return crc ^ 0xFFFF
+        return crc16_x25(data)
 
 
     # ------------------------------------------------------------
@@ -267,6 +418,16 @@ class il2p_decoder(gr.basic_block):
         total_len = len(data)
         il2p_pack = Il2pPacket(packet_error_type=[])
         il2p_pack.processing_run_id = self.processing_run_id
+        il2p_pack.segment = self.segment
+        if self.sample_offset_of is not None:
+            bit_offset = pmt.dict_ref(pmt.car(msg), pmt.intern("bit_offset"), pmt.PMT_NIL)
+            mark = pmt.dict_ref(pmt.car(msg), pmt.intern("frame_mark"), pmt.PMT_NIL)
+            if not pmt.is_null(mark):
+                mark = (pmt.to_uint64(pmt.car(mark)), pmt.to_uint64(pmt.cdr(mark)))
+            else:
+                mark = None
+            if not pmt.is_null(bit_offset):
+                il2p_pack.sample_offset = int(self.sample_offset_of(pmt.to_uint64(bit_offset), mark))
 
         # Minimum frame length guard (LEN + EXTRA + FRAMING + HEADER + HEADER_PARITY + PAYLOAD_PARITY + CRC)
         if total_len < 40:
@@ -318,11 +479,11 @@ class il2p_decoder(gr.basic_block):
             return
 
         # Descramble header
-        header_plain = self._descramble_bits(header_corr)
+        header_plain, header_states = self._descramble(header_corr)
         il2p_pack.header = header_plain
 
         # Scrambler alignment check on header
-        scr_ok = self._validate_scrambler(header_corr, header_plain)
+        scr_ok = self._validate_scrambler(header_corr, header_plain, header_states)
         if not scr_ok:
             print("[IL2P] scrambler mismatch")
             il2p_pack.packet_error_type.append("[IL2P] scrambler mismatch")
@@ -376,9 +537,8 @@ class il2p_decoder(gr.basic_block):
 
         received_fcs = ((n3 & 0xF) << 12) | ((n2 & 0xF) << 8) | ((n1 & 0xF) << 4) | (n0 & 0xF)
 
-        # Build AX.25 frame and compute FCS
-        ax25_frame = self.ax25_header + payload_plain
-        computed_fcs = self._crc16_x25(ax25_frame)
+        # Compute FCS over the AX.25 frame (fixed header state + payload)
+        computed_fcs = crc16_x25_final(crc16_x25_update(self.ax25_header_crc, payload_plain))
         crc_ok = (computed_fcs == received_fcs)
         print(f"CRC check: {crc_ok}, payload_len={len(payload_plain)}")
         if crc_ok:
@@ -387,9 +547,9 @@ class il2p_decoder(gr.basic_block):
         il2p_pack.packet_index = self.packet_index
         self.packet_index += 1
         
-        # this provides the option to not store the packets to the database
-        if self.store_packets:
-            store_packet(il2p_pack)
+        # this provides the option to not store the packets to the database;
+        # the run's packet counters are kept either way
+        self.packet_writer.add(il2p_pack, store=bool(self.store_packets))
 
         # -----------------------------
         # Write raw payload bytes (no delimiters)
@@ -415,8 +575,19 @@ class il2p_decoder(gr.basic_block):
         self.message_port_pub(pmt.intern("out"), out_pdu)
 
 
+    def stop(self):
+        # Flowgraph is stopping: write out any buffered packets
+        self.packet_writer.close()
+        return True
+
+
     def __del__(self):
-        # Best-effort close of the output file
+        # Best-effort flush of buffered packets and close of the output file
+        try:
+            if hasattr(self, "packet_writer"):
+                self.packet_writer.close()
+        except Exception:
+            pass
         try:
             if hasattr(self, "outfile") and self.outfile is not None:
                 self.outfile.close()
@@ -0,0 +1,77 @@
+"""
+Doppler Derotator Block
+-----------------------
+
+Removes the Doppler shift from the playback IQ stream with a continuous-phase
+rotator, so the channel filter downstream can stay at a fixed center frequency
+instead of being retuned once per second.
+
+The Doppler curve (seconds from start of capture, center difference in Hz)
+arrives as a 'doppler_curve' stream tag from the Doppler IQ Playback block.
+Every sample is shifted by the center difference linearly interpolated at its
+own time, and the phase carries over between work() calls, so there are no
+frequency or phase steps.  Until a curve tag is seen samples pass through
+unchanged.  A later tag replaces the curve; the playback block sends one
+after every jump when it plays only parts of the capture.
+"""
+
+import numpy as np
+from gnuradio import gr
+import pmt
+
+
+class blk(gr.sync_block):
+    """
+    Doppler Derotator (Complex In/Out)
+
+    Multiplies each sample by exp(-j*phase), where phase accumulates
+    2*pi*center_diff(t)/samp_rate per sample and center_diff(t) is
+    interpolated from the 'doppler_curve' tag sent by the playback block.
+    """
+
+    def __init__(self, samp_rate=153600, tag_key="doppler_curve"):
+        gr.sync_block.__init__(
+            self,
+            name='Doppler Derotator',
+            in_sig=[np.complex64],
+            out_sig=[np.complex64]
+        )
+
+        self.samp_rate = float(samp_rate)
+        self.tag_key = pmt.intern(tag_key)
+
+        self.curve_t = None          # seconds from curve_offset
+        self.curve_diff = None       # center difference (Hz)
+        self.curve_offset = 0        # absolute sample index of t = 0
+        self.phase = 0.0             # radians, kept in [0, 2*pi)
+
+    def _take_curve(self, tag):
+        self.curve_t = np.array(pmt.f64vector_elements(pmt.car(tag.value)))
+        self.curve_diff = np.array(pmt.f64vector_elements(pmt.cdr(tag.value)))
+        self.curve_offset = tag.offset
+
+    def work(self, input_items, output_items):
+        inp = input_items[0]
+        out = output_items[0]
+        n = len(inp)
+
+        for tag in self.get_tags_in_window(0, 0, n):
+            if tag.key == self.tag_key:
+                self._take_curve(tag)
+
+        if self.curve_t is None:
+            out[:] = inp
+            return n
+
+        # Frequency at each sample; phase of sample k includes steps 0..k-1
+        start = self.nitems_read(0) - self.curve_offset
+        t = (start + np.arange(n)) / self.samp_rate
+        step = (2.0 * np.pi / self.samp_rate) * np.interp(t, self.curve_t, self.curve_diff)
+        phase = np.cumsum(step)
+        phase -= step
+        phase += self.phase
+
+        out[:] = inp * np.exp(-1j * phase).astype(np.complex64)
+
+        self.phase = float(np.mod(phase[-1] + step[-1], 2.0 * np.pi))
+        return n
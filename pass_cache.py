@@ -0,0 +1,188 @@
+import threading
+import logging
+from datetime import datetime, timedelta
+import pytz
+from db import connect
+from tle_plot import get_timescale, get_satellite, get_observer, passes_between
+
+# Passes are predicted this far ahead, and recomputed once less than
+# HORIZON_DAYS - REFRESH_DAYS of the window is left
+HORIZON_DAYS = 5
+REFRESH_DAYS = 1
+MIN_ELEVATION_DEG = 10.0
+
+TLE_KNOWN_SQL = "SELECT 1 FROM tle_history WHERE satellite_id = ? AND tle_line1 = ? AND tle_line2 = ?"
+LATEST_EPOCH_SQL = "SELECT epoch_utc FROM tle_history WHERE satellite_id = ? ORDER BY epoch_utc DESC LIMIT 1"
+UPCOMING_PASSES_SQL = """SELECT satellite_pass.aos_utc, satellite_pass.culmination_utc,
+    satellite_pass.los_utc, satellite_pass.max_elevation_deg
+    FROM satellite_pass JOIN tle_history ON tle_history.id = satellite_pass.tle_history_id
+    WHERE satellite_pass.satellite_id = ? AND satellite_pass.location_id = ? AND satellite_pass.aos_utc >= ?
+    AND tle_history.tle_line1 = ? AND tle_history.tle_line2 = ?
+    ORDER BY satellite_pass.aos_utc LIMIT ?"""
+
+
+def utc_iso(dt):
+    """Naive-UTC ISO text to the second, the format of the *_utc pass columns."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(pytz.UTC).replace(tzinfo=None)
+    return dt.isoformat(timespec="seconds")
+
+
+def tle_epoch(tle1):
+    """Epoch of a TLE (line 1, columns 19-32: two-digit year and day of
+    year) as naive-UTC ISO text."""
+    year = int(tle1[18:20])
+    year += 2000 if year < 57 else 1900
+    day = float(tle1[20:32])
+    return utc_iso(datetime(year, 1, 1) + timedelta(days=day - 1))
+
+
+def store_tle(db, satellite_id, tle1, tle2, source):
+    """
+    Record a TLE in tle_history unless it is already there.  When it is the
+    satellite's newest (by epoch), the satellite's predicted passes are
+    dropped; the pass cache recomputes them from this TLE.  Returns True in
+    that case.  Caller commits, then wakes the pass cache.
+    """
+    if db.execute(TLE_KNOWN_SQL, (satellite_id, tle1, tle2)).fetchone():
+        return False
+    epoch = tle_epoch(tle1)
+    latest = db.execute(LATEST_EPOCH_SQL, (satellite_id,)).fetchone()
+    db.execute("""INSERT INTO tle_history (satellite_id, epoch_utc, tle_line1, tle_line2, source, downloaded_at)
+        VALUES (?, ?, ?, ?, ?, ?)""", (satellite_id, epoch, tle1, tle2, source, utc_iso(datetime.utcnow())))
+    if latest is not None and epoch < latest[0]:
+        return False
+    db.execute("DELETE FROM satellite_pass WHERE satellite_id = ?", (satellite_id,))
+    db.execute("DELETE FROM pass_prediction WHERE satellite_id = ?", (satellite_id,))
+    return True
+
+
+def invalidate_location(db, location_id):
+    """Drop the passes predicted for a location whose coordinates changed.
+    Caller commits, then wakes the pass cache."""
+    db.execute("DELETE FROM satellite_pass WHERE location_id = ?", (location_id,))
+    db.execute("DELETE FROM pass_prediction WHERE location_id = ?", (location_id,))
+
+
+def upcoming_passes(db, satellite_id, location_id, tle1, tle2, count=3):
+    """
+    The next `count` predicted passes for this satellite and location, as
+    generate_orbit_plots expects them, if they were predicted from exactly
+    this TLE; otherwise None and the caller searches itself.
+    """
+    rows = db.execute(UPCOMING_PASSES_SQL,
+                      (satellite_id, location_id, utc_iso(datetime.utcnow()), tle1, tle2, count)).fetchall()
+    if len(rows) < count:
+        return None
+    ts = get_timescale()
+    to_time = lambda text: ts.from_datetime(datetime.fromisoformat(text).replace(tzinfo=pytz.UTC))
+    return [(to_time(aos), to_time(tca), to_time(los), max_elev)
+            for aos, tca, los, max_elev in rows]
+
+
+class PassCache:
+    """Keep satellite_pass filled with the next HORIZON_DAYS of passes for
+    every (satellite, location) pair, from the satellite's latest TLE.
+
+    A background thread checks the pairs every `interval` seconds and
+    recomputes those whose prediction is missing, was made from an older
+    TLE, or is running out.  store_tle and invalidate_location drop stale
+    predictions; wake() then starts a check right away.
+    """
+
+    def __init__(self, db_path, interval=3600):
+        self.db_path = db_path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.wake_event = threading.Event()
+        self.start_lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """Start the background thread, once; later calls do nothing."""
+        with self.start_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop, name="pass-cache", daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
+
+    def wake(self):
+        self.wake_event.set()
+
+    def _loop(self):
+        while not self.stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"pass prediction failed: {e}")
+            self.wake_event.wait(self.interval)
+            self.wake_event.clear()
+
+    def refresh(self):
+        """Recompute the pairs whose predicted passes are stale."""
+        now = datetime.now(pytz.UTC)
+        end = now + timedelta(days=HORIZON_DAYS)
+        keep_until = utc_iso(now + timedelta(days=HORIZON_DAYS - REFRESH_DAYS))
+
+        conn = connect(self.db_path)
+        try:
+            tles = []
+            for (satellite_id,) in conn.execute("SELECT id FROM satellite").fetchall():
+                tle = conn.execute("""SELECT id, tle_line1, tle_line2 FROM tle_history
+                    WHERE satellite_id = ? ORDER BY epoch_utc DESC LIMIT 1""", (satellite_id,)).fetchone()
+                if tle is not None:
+                    tles.append((satellite_id, *tle))
+            locations = conn.execute("SELECT id, lat_deg, lon_deg, elev_m FROM location").fetchall()
+            predicted = {(s, l): (t, e) for s, l, t, e in conn.execute(
+                "SELECT satellite_id, location_id, tle_history_id, end_utc FROM pass_prediction")}
+
+            for satellite_id, tle_id, tle1, tle2 in tles:
+                for location_id, lat, lon, elev in locations:
+                    if self.stop_event.is_set():
+                        return
+                    current = predicted.get((satellite_id, location_id))
+                    if current is not None and current[0] == tle_id and current[1] >= keep_until:
+                        continue
+                    try:
+                        passes = passes_between(get_satellite(tle1, tle2), get_observer(location_id, lat, lon, elev),
+                                                get_timescale(), now, end, MIN_ELEVATION_DEG)
+                    except Exception as e:
+                        logging.error(f"pass prediction for satellite {satellite_id} at location {location_id} failed: {e}")
+                        continue
+                    self._store(conn, satellite_id, location_id, tle_id, now, end, passes)
+        finally:
+            conn.close()
+
+    def _store(self, conn, satellite_id, location_id, tle_id, start, end, passes):
+        rows = [(satellite_id, location_id, tle_id, utc_iso(aos.utc_datetime()), utc_iso(tca.utc_datetime()),
+                 utc_iso(los.utc_datetime()), float(max_elev))
+                for aos, tca, los, max_elev in passes]
+        with conn:
+            conn.execute("DELETE FROM satellite_pass WHERE satellite_id = ? AND location_id = ?",
+                         (satellite_id, location_id))
+            conn.executemany("""INSERT INTO satellite_pass (satellite_id, location_id, tle_history_id,
+                aos_utc, culmination_utc, los_utc, max_elevation_deg) VALUES (?, ?, ?, ?, ?, ?, ?)""", rows)
+            conn.execute("""INSERT OR REPLACE INTO pass_prediction
+                (satellite_id, location_id, tle_history_id, start_utc, end_utc, computed_at)
+                VALUES (?, ?, ?, ?, ?, ?)""",
+                (satellite_id, location_id, tle_id, utc_iso(start), utc_iso(end), utc_iso(datetime.utcnow())))
+        logging.debug(f"predicted {len(rows)} passes for satellite {satellite_id} at location {location_id}")
+
+
+def init_app(app):
+    """Create and start the app's pass cache; FLASK_PASS_REFRESH_INTERVAL
+    sets the check period in seconds (default 3600)."""
+    cache = PassCache(app.config["DATABASE"],
+                      float(app.config.get("PASS_REFRESH_INTERVAL") or 3600))
+    app.extensions["pass_cache"] = cache
+    # Started by the first request, like the capture index: the debug
+    # reloader's watcher process runs create_app too but serves none
+    app.before_request(cache.start)
+
+
+def get_pass_cache():
+    from flask import current_app
+    return current_app.extensions["pass_cache"]
@@ -0,0 +1,119 @@
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import pytz
+from db import connect
+from pass_cache import utc_iso, MIN_ELEVATION_DEG
+from tle_plot import get_timescale, get_satellite, get_observer, passes_between
+
+MAX_PLAN_DAYS = 7
+
+SATELLITES_SQL = "SELECT id, name FROM satellite ORDER BY name"
+LATEST_TLE_SQL = """SELECT tle_line1, tle_line2 FROM tle_history
+    WHERE satellite_id = ? ORDER BY epoch_utc DESC LIMIT 1"""
+LOCATIONS_SQL = "SELECT id, name, lat_deg, lon_deg, elev_m FROM location ORDER BY name"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process pool for the event searches, one worker per core, started on
+    first use.  Workers are spawned rather than forked: the server process
+    has threads running."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                        mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def predict_pair(job):
+    """
+    Passes of one satellite over one location, in a pool worker.
+
+    job is (tle1, tle2, location_id, lat, lon, elev, start, end, min_elevation)
+    with aware start/end datetimes; returns (aos, culmination, los,
+    max_elevation_deg) tuples with the times as naive-UTC ISO text.  Each
+    worker keeps its own satellite cache across jobs.  The observer is built
+    fresh: editing a location evicts it only in the web process, so a
+    worker's cached observer could be at the old site.
+    """
+    tle1, tle2, location_id, lat, lon, elev, start, end, min_elevation = job
+    passes = passes_between(get_satellite(tle1, tle2), get_observer(None, lat, lon, elev),
+                            get_timescale(), start, end, min_elevation)
+    return [(utc_iso(aos.utc_datetime()), utc_iso(tca.utc_datetime()), utc_iso(los.utc_datetime()),
+             float(max_elev)) for aos, tca, los, max_elev in passes]
+
+
+def find_conflicts(timeline):
+    """Fill each pass's "conflicts" with the timeline indices of the passes
+    that overlap it at the same location (one antenna, one satellite at a
+    time).  timeline must be sorted by AOS."""
+    by_location = {}
+    for i, p in enumerate(timeline):
+        by_location.setdefault(p["location_id"], []).append(i)
+    for indices in by_location.values():
+        in_view = []
+        for i in indices:
+            in_view = [j for j in in_view if timeline[j]["los_utc"] > timeline[i]["aos_utc"]]
+            for j in in_view:
+                timeline[i]["conflicts"].append(j)
+                timeline[j]["conflicts"].append(i)
+            in_view.append(i)
+
+
+def plan_passes(db_path, days=2, min_elevation=MIN_ELEVATION_DEG, start=None):
+    """
+    Upcoming passes of every satellite with a TLE over every location.
+
+    Each (satellite, location) pair is searched in the process pool, using
+    the satellite's latest TLE from tle_history.  Returns the passes of all
+    pairs as one list of dicts sorted by AOS, with "conflicts" listing the
+    overlapping passes at the same location.
+    """
+    start = start or datetime.now(pytz.UTC)
+    end = start + timedelta(days=min(days, MAX_PLAN_DAYS))
+
+    conn = connect(db_path)
+    try:
+        satellites = []
+        for satellite_id, name in conn.execute(SATELLITES_SQL).fetchall():
+            tle = conn.execute(LATEST_TLE_SQL, (satellite_id,)).fetchone()
+            if tle is not None:
+                satellites.append((satellite_id, name, *tle))
+        locations = conn.execute(LOCATIONS_SQL).fetchall()
+    finally:
+        conn.close()
+
+    pairs = [(s, l) for s in satellites for l in locations]
+    jobs = [(tle1, tle2, location_id, lat, lon, elev, start, end, min_elevation)
+            for (_, _, tle1, tle2), (location_id, _, lat, lon, elev) in pairs]
+    if len(jobs) > 1:
+        results = get_pool().map(predict_pair, jobs)
+    else:
+        results = map(predict_pair, jobs)
+
+    timeline = []
+    for ((satellite_id, satellite_name, _, _), (location_id, location_name, *_)), passes in zip(pairs, results):
+        for aos, tca, los, max_elev in passes:
+            timeline.append({
+                "satellite_id": satellite_id,
+                "satellite_name": satellite_name,
+                "location_id": location_id,
+                "location_name": location_name,
+                "aos_utc": aos,
+                "culmination_utc": tca,
+                "los_utc": los,
+                "duration": int((datetime.fromisoformat(los) - datetime.fromisoformat(aos)).total_seconds()),
+                "max_elevation_deg": round(max_elev, 1),
+                "conflicts": [],
+            })
+    timeline.sort(key=lambda p: (p["aos_utc"], p["satellite_name"], p["location_name"]))
+    find_conflicts(timeline)
+    return {"start_utc": utc_iso(start), "end_utc": utc_iso(end), "passes": timeline}
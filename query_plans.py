@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+EXPLAIN QUERY PLAN check for the queries the web routes run.
+
+Every query must reach its rows through an index (or the rowid) and get its
+ORDER BY from an index.  Queries that list a whole table on purpose are
+marked "scan"; queries that sort a small, already-filtered result on an
+expression are marked "sort".  The SQL is imported from the modules that
+run it; tests/test_query_plans.py runs the check under pytest.
+
+    python3 query_plans.py                  # fresh schema in memory
+    python3 query_plans.py observations.db  # a copy of an existing database,
+                                            # migrated like the app does
+
+Exits 1 and lists the offending plans if any query misses its index.
+"""
+
+import os
+import sqlite3
+import sys
+
+import app
+import pass_cache
+import pass_planner
+from db import setup_db
+from blueprints import captures, locations, operators, packet, processing, satellites, ssdv
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+
+
+def packet_page(*filters, order="ASC"):
+    """The packet list query for these filters (as processing.view builds it)."""
+    where, params = processing.packet_filters(*filters)
+    where.insert(0, "processing_run_id = ?")
+    where.append("id > ?" if order == "ASC" else "id < ?")
+    return processing.packet_page_sql(where, order), (1, *params, 500, 101)
+
+
+def export(columns, *filters):
+    """The export query for these filters (as processing.export_rows builds it)."""
+    where, params = processing.packet_filters(*filters)
+    where.insert(0, "processing_run_id = ?")
+    return processing.export_sql(columns, where), (1, *params)
+
+
+NOW = "2026-01-01T00:00:00"
+
+# (route, sql, params, allowed)
+ROUTE_QUERIES = [
+    ("index", app.RECENT_CAPTURES_SQL, (), set()),
+    ("index", app.UPCOMING_PASSES_SQL, (NOW, 10), set()),
+    ("captures.index", captures.LIST_SQL, (), {"scan"}),
+    ("captures.new", captures.SATELLITES_SQL, (), set()),
+    ("captures.new", captures.LOCATIONS_SQL, (), set()),
+    ("captures.new", pass_cache.TLE_KNOWN_SQL, (1, "1", "2"), set()),
+    ("captures.new", pass_cache.LATEST_EPOCH_SQL, (1,), set()),
+    ("captures.fetch_tle", captures.CATALOG_NUMBER_SQL, (1,), set()),
+    ("captures.preview_orbit", captures.LOCATION_SQL, (1,), set()),
+    ("captures.preview_orbit", pass_cache.UPCOMING_PASSES_SQL, (1, 1, NOW, "1", "2", 3), set()),
+    ("captures.plan", pass_planner.SATELLITES_SQL, (), set()),
+    ("captures.plan", pass_planner.LOCATIONS_SQL, (), set()),
+    ("captures.plan", pass_planner.LATEST_TLE_SQL, (1,), set()),
+    ("captures.serve_capture_file", captures.CAPTURE_FILE_SQL, ("x.wav",), set()),
+    ("captures.view_capture", captures.CAPTURE_SQL, (1,), set()),
+    ("satellites.list_satellites", satellites.LIST_SQL, (), set()),
+    ("locations.index", locations.LIST_SQL, (), set()),
+    ("operators.list_operators", operators.LIST_SQL, (), set()),
+    ("packet.detail", packet.DETAIL_SQL, (1,), set()),
+    ("ssdv.run", ssdv.OUTPUT_FILE_SQL, (1,), set()),
+    ("processing.index", processing.LIST_SQL, (), {"scan"}),
+    ("processing.new", processing.SOURCE_FILE_SQL, (1,), set()),
+    ("processing.new", processing.SESSIONS_SQL, (), {"scan"}),
+    ("processing.new", processing.CAPTURE_TIMING_SQL, (1,), set()),
+    ("processing.view", processing.RUN_SQL, (1,), set()),
+    ("processing.view", *packet_page(""), set()),
+    ("processing.view", *packet_page("1", order="DESC"), set()),
+    ("processing.view", *packet_page("0"), set()),
+    ("processing.view", *packet_page("", order="DESC"), set()),
+    ("processing.export", processing.RUN_EXISTS_SQL, (1,), set()),
+    ("processing.export", *export("payload", "1"), set()),
+    ("processing.export", *export(", ".join(processing.EXPORT_COLUMNS), ""), set()),
+    ("processing.view_sweep", processing.SWEEP_SQL, (1,), set()),
+    ("processing.view_sweep", processing.SWEEP_RUNS_SQL, (1,), {"sort"}),
+]
+
+
+def plan_problems(detail, allowed):
+    """Return what is wrong with one EXPLAIN QUERY PLAN detail line."""
+    if detail.startswith("SCAN ") and "USING" not in detail and "scan" not in allowed:
+        return "full table scan"
+    if "USE TEMP B-TREE" in detail and "sort" not in allowed:
+        return "sort without an index"
+    return None
+
+
+def query_problems(db, sql, params, allowed):
+    """EXPLAIN QUERY PLAN one query; return (detail, problem) for each plan
+    line that misses an index."""
+    return [(detail, problem)
+            for *_, detail in db.execute("EXPLAIN QUERY PLAN " + sql, params)
+            for problem in [plan_problems(detail, allowed)] if problem]
+
+
+def check_query_plans(db):
+    """Run EXPLAIN QUERY PLAN for every route query; return a list of
+    (route, sql, detail, problem) for plans that miss an index."""
+    return [(route, " ".join(sql.split()), detail, problem)
+            for route, sql, params, allowed in ROUTE_QUERIES
+            for detail, problem in query_problems(db, sql, params, allowed)]
+
+
+def open_schema_db(path=None):
+    """An in-memory database with the current schema: empty, or a copy of
+    the database at path (left untouched) brought up to date by the app's
+    migrations."""
+    db = sqlite3.connect(":memory:")
+    if path:
+        source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            source.backup(db)
+        finally:
+            source.close()
+    with open(SCHEMA_PATH) as f:
+        setup_db(db, f.read())
+    return db
+
+
+def main(argv):
+    db = open_schema_db(argv[1] if len(argv) > 1 else None)
+
+    failures = check_query_plans(db)
+    for route, sql, detail, problem in failures:
+        print(f"{route}: {problem}\n    {sql}\n    {detail}")
+    print(f"{len(ROUTE_QUERIES)} queries checked, {len(failures)} problems")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -44,28 +44,46 @@ CREATE TABLE IF NOT EXISTS "capture_session" (
 	"location_id"	INTEGER,
 	"output_path"	TEXT NOT NULL DEFAULT '/home/pi/captures',
 	"created_at"	TEXT NOT NULL DEFAULT (datetime('now')),
+	"wav_filename"	TEXT,
+	"sample_rate"	INTEGER,
+	"frame_count"	INTEGER,
+	"duration_s"	REAL,
+	"peak_time_s"	REAL,
+	"power_envelope"	BLOB,
 	PRIMARY KEY("id"),
 	FOREIGN KEY("location_id") REFERENCES "location"("id"),
 	FOREIGN KEY("operator_id") REFERENCES "operator"("id"),
 	FOREIGN KEY("satellite_id") REFERENCES "satellite"("id")
 );
+CREATE TABLE IF NOT EXISTS capture_file (
+    capture_session_id INTEGER PRIMARY KEY REFERENCES capture_session(id),
+    path TEXT NOT NULL,
+    size_bytes INTEGER,
+    mtime REAL,
+    duration_s REAL,
+    sample_rate INTEGER,
+    channels INTEGER,
+    scanned_at TEXT NOT NULL
+);
 CREATE TABLE IF NOT EXISTS "packet" (
 	"id"	INTEGER,
 	"processing_run_id"	INTEGER NOT NULL,
 	"packet_index"	INTEGER NOT NULL,
 	"capture_time_utc"	TEXT,
 	"length_bytes"	INTEGER NOT NULL,
-	"header_hex"	TEXT NOT NULL,
-	"header_parity_hex"	TEXT NOT NULL,
-	"payload_hex"	TEXT NOT NULL,
-	"payload_parity_hex"	TEXT NOT NULL,
-	"crc_hex"	TEXT NOT NULL,
+	"header"	BLOB NOT NULL,
+	"header_parity"	BLOB NOT NULL,
+	"payload"	BLOB NOT NULL,
+	"payload_parity"	BLOB NOT NULL,
+	"crc"	BLOB NOT NULL,
 	"header_ok"	INTEGER NOT NULL,
 	"payload_ok"	INTEGER NOT NULL,
 	"crc_ok"	INTEGER NOT NULL,
 	"scrambler_ok"	INTEGER NOT NULL,
 	"packet_error_type"	TEXT,
 	"payload_byte_count"	INTEGER NOT NULL,
+	"sample_offset"	INTEGER,
+	"segment"	INTEGER,
 	PRIMARY KEY("id"),
 	FOREIGN KEY("processing_run_id") REFERENCES "processing_run"("id")
 );
@@ -83,9 +101,21 @@ CREATE TABLE IF NOT EXISTS "processing_run" (
 	"access_threshold"	INTEGER,
 	"packet_count"	INTEGER,
 	"good_packets"	INTEGER, is_ssdv INTEGER DEFAULT 0,
+	"output_file"	TEXT,
+	"status"	TEXT,
+	"pid"	INTEGER,
+	"sweep_id"	INTEGER REFERENCES sweep(id),
+	"header_ok_packets"	INTEGER,
+	"scrambler_ok_packets"	INTEGER,
 	PRIMARY KEY("id"),
 	FOREIGN KEY("capture_session_id") REFERENCES "capture_session"("id")
 );
+CREATE TABLE IF NOT EXISTS sweep (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    capture_session_id INTEGER NOT NULL REFERENCES capture_session(id),
+    created_at TEXT NOT NULL,
+    notes TEXT
+);
 CREATE TABLE IF NOT EXISTS ssdv_run (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     payload_file TEXT NOT NULL,
@@ -93,3 +123,47 @@ CREATE TABLE IF NOT EXISTS ssdv_run (
     run_time_utc TEXT DEFAULT CURRENT_TIMESTAMP,
     processing_run_id INTEGER REFERENCES processing_run(id)
 );
+
+-- Upcoming passes for each (satellite, location) from the satellite's latest
+-- TLE, kept by pass_cache.py; pass_prediction records the window covered
+CREATE TABLE IF NOT EXISTS pass_prediction (
+    satellite_id    INTEGER NOT NULL REFERENCES satellite(id),
+    location_id     INTEGER NOT NULL REFERENCES location(id),
+    tle_history_id  INTEGER NOT NULL REFERENCES tle_history(id),
+    start_utc       TEXT NOT NULL,
+    end_utc         TEXT NOT NULL,
+    computed_at     TEXT NOT NULL,
+    PRIMARY KEY (satellite_id, location_id)
+);
+CREATE TABLE IF NOT EXISTS satellite_pass (
+    id                  INTEGER PRIMARY KEY,
+    satellite_id        INTEGER NOT NULL REFERENCES satellite(id),
+    location_id         INTEGER NOT NULL REFERENCES location(id),
+    tle_history_id      INTEGER NOT NULL REFERENCES tle_history(id),
+    aos_utc             TEXT NOT NULL,
+    culmination_utc     TEXT NOT NULL,
+    los_utc             TEXT NOT NULL,
+    max_elevation_deg   REAL NOT NULL
+);
+
+-- Packet fields as hex text, for display
+CREATE VIEW IF NOT EXISTS packet_hex AS
+SELECT packet.*,
+       hex(header) AS header_hex,
+       hex(header_parity) AS header_parity_hex,
+       hex(payload) AS payload_hex,
+       hex(payload_parity) AS payload_parity_hex,
+       hex(crc) AS crc_hex
+FROM packet;
+
+-- Indexes for the route queries; query_plans.py checks that they are used
+CREATE INDEX IF NOT EXISTS idx_packet_run ON packet (processing_run_id);
+CREATE INDEX IF NOT EXISTS idx_packet_run_crc ON packet (processing_run_id, crc_ok);
+CREATE INDEX IF NOT EXISTS idx_processing_run_sweep ON processing_run (sweep_id);
+CREATE INDEX IF NOT EXISTS idx_capture_session_start ON capture_session (start_time_utc);
+CREATE INDEX IF NOT EXISTS idx_capture_session_wav_filename ON capture_session (wav_filename);
+CREATE INDEX IF NOT EXISTS idx_satellite_name ON satellite (name);
+CREATE INDEX IF NOT EXISTS idx_location_name ON location (name);
+CREATE INDEX IF NOT EXISTS idx_tle_history_satellite ON tle_history (satellite_id, epoch_utc);
+CREATE INDEX IF NOT EXISTS idx_satellite_pass_pair ON satellite_pass (satellite_id, location_id, aos_utc);
+CREATE INDEX IF NOT EXISTS idx_satellite_pass_aos ON satellite_pass (aos_utc);
@@ -0,0 +1,86 @@
+import hashlib
+import logging
+from db import connect, recount_runs
+
+# Each segment starts this much before the previous one ends, so a packet cut
+# by a segment boundary is decoded whole by the other segment.  A longest
+# IL2P frame lasts about a second at 9600 baud; the rest lets the symbol
+# sync and squelch settle.
+OVERLAP_S = 5.0
+# Copies of one packet from two segments are found at nearly the same WAV
+# frame; the same payload further apart than this is a new transmission.
+DEDUP_WINDOW_S = 0.5
+MAX_SEGMENTS = 16
+
+
+def segment_bounds(duration_s, n, overlap_s=OVERLAP_S):
+    """
+    Split [0, duration_s) into n time segments for passdata_headless.py
+    --start-s/--stop-s, each reaching overlap_s back into the one before.
+    The last segment's stop is 0 (to the end of the file).
+    """
+    n = max(1, int(n))
+    step = duration_s / n
+    bounds = []
+    for i in range(n):
+        start = max(0.0, i * step - overlap_s) if i else 0.0
+        stop = (i + 1) * step if i < n - 1 else 0
+        bounds.append((round(start, 3), round(stop, 3)))
+    return bounds
+
+
+def overlap_windows(bounds, sample_rate):
+    """[start, stop) WAV frame ranges covered by two segments."""
+    return [(int(start * sample_rate), int(bounds[i - 1][1] * sample_rate))
+            for i, (start, _) in enumerate(bounds) if i]
+
+
+def duplicate_packets(rows, window_frames):
+    """
+    Ids of the packets in rows, (id, sample_offset, segment, payload) sorted
+    by sample_offset, that another segment already decoded: same payload
+    within window_frames before them.  The first copy is kept; repeats
+    within one segment are separate transmissions and are all kept.
+    """
+    last_seen = {}
+    duplicates = []
+    for id, sample_offset, segment, payload in rows:
+        key = hashlib.sha1(payload).digest()
+        seen = last_seen.get(key)
+        if seen is not None and seen[1] != segment and sample_offset - seen[0] <= window_frames:
+            duplicates.append(id)
+        else:
+            last_seen[key] = (sample_offset, segment)
+    return duplicates
+
+
+def merge_segment_packets(db_path, run_id, sample_rate, bounds, window_s=DEDUP_WINDOW_S):
+    """
+    After every segment of a run has finished: delete the good packets
+    (CRC OK, non-empty payload) decoded by two segments in the overlaps
+    given by bounds (as from segment_bounds), and recount the run's packet
+    counters.  Failed frames, packets outside the overlaps and packets
+    without a sample_offset or segment are always kept.  Returns the number
+    deleted.  A run that stores no packets keeps its counters as the
+    segments left them: there is nothing to compare or recount.
+    """
+    window_frames = int(window_s * sample_rate)
+    conn = connect(db_path)
+    try:
+        if not conn.execute("SELECT store_packets FROM processing_run WHERE id = ?", (run_id,)).fetchone()[0]:
+            return 0
+        rows = []
+        # widened by the window, for copies found just either side of an edge
+        for start, stop in overlap_windows(bounds, sample_rate):
+            rows += conn.execute("""SELECT id, sample_offset, segment, payload FROM packet
+                WHERE processing_run_id = ? AND crc_ok = 1 AND length(payload) > 0
+                AND segment IS NOT NULL AND sample_offset >= ? AND sample_offset < ?
+                ORDER BY sample_offset, id""", (run_id, start - window_frames, stop + window_frames)).fetchall()
+        duplicates = duplicate_packets(rows, window_frames)
+        with conn:
+            conn.executemany("DELETE FROM packet WHERE id = ?", [(id,) for id in duplicates])
+            recount_runs(conn, "id = ?", (run_id,))
+    finally:
+        conn.close()
+    logging.debug(f"decode run {run_id}: removed {len(duplicates)} duplicate packets from segment overlaps")
+    return len(duplicates)
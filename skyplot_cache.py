@@ -0,0 +1,50 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from tle_plot import render_skyplot
+
+# A preview within the same bucket reuses the plot already drawn
+BUCKET_S = 600
+# Files older than this are removed when a new plot is written
+KEEP_S = 24 * 3600
+FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+
+def skyplot_name(tle1, tle2, location_id, timezone_str, fmt, now=None):
+    """Cache file name for a sky plot: a hash of the TLE, location, timezone
+    and BUCKET_S time bucket, so the same preview maps to the same file."""
+    bucket = int((now or time.time()) // BUCKET_S)
+    key = "\n".join((tle1, tle2, str(location_id), timezone_str, str(bucket)))
+    return hashlib.sha1(key.encode()).hexdigest() + "." + fmt
+
+
+def cached_skyplot(cache_dir, name, tracks):
+    """Render tracks into cache_dir/name unless that file already exists.
+    The plot is written to a temporary file and renamed into place, so a
+    concurrent request never serves half a file."""
+    path = os.path.join(cache_dir, name)
+    if os.path.exists(path):
+        return path
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(render_skyplot(tracks, name.rsplit(".", 1)[1]))
+    os.replace(tmp, path)
+    prune(cache_dir)
+    return path
+
+
+def prune(cache_dir, keep_s=KEEP_S):
+    """Delete cached plots last written more than keep_s seconds ago."""
+    cutoff = time.time() - keep_s
+    for entry in os.scandir(cache_dir):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError as e:
+            logging.debug(f"sky plot cache: could not remove {entry.path}: {e}")
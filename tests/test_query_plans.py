@@ -0,0 +1,32 @@
+import os
+import pytest
+import query_plans
+from query_plans import ROUTE_QUERIES, open_schema_db, query_problems
+
+OBSERVATIONS_DB = os.path.join(os.path.dirname(query_plans.SCHEMA_PATH), "observations.db")
+
+
+@pytest.fixture(scope="module")
+def schema_db():
+    db = open_schema_db()
+    yield db
+    db.close()
+
+
+@pytest.fixture(scope="module")
+def migrated_db():
+    if not os.path.exists(OBSERVATIONS_DB):
+        pytest.skip("no observations.db")
+    db = open_schema_db(OBSERVATIONS_DB)
+    yield db
+    db.close()
+
+
+@pytest.mark.parametrize("route, sql, params, allowed", ROUTE_QUERIES)
+def test_route_query_uses_index(schema_db, route, sql, params, allowed):
+    assert query_problems(schema_db, sql, params, allowed) == []
+
+
+@pytest.mark.parametrize("route, sql, params, allowed", ROUTE_QUERIES)
+def test_route_query_uses_index_after_migration(migrated_db, route, sql, params, allowed):
+    assert query_problems(migrated_db, sql, params, allowed) == []
@@ -2,10 +2,97 @@ from skyfield.api import load, EarthSatellite, wgs84
 import matplotlib.pyplot as plt
 import numpy as np
 import io
-import base64
 from datetime import datetime, timedelta
+from collections import OrderedDict
+import threading
 import pytz
 
+SATELLITE_CACHE_SIZE = 32
+OBSERVER_CACHE_SIZE = 16
+
+
+class LruCache:
+    """Thread-safe least-recently-used cache of at most `maxsize` values."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.values = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, create):
+        """Return the value cached under key, calling create() on a miss."""
+        with self.lock:
+            if key in self.values:
+                self.values.move_to_end(key)
+                return self.values[key]
+        value = create()
+        with self.lock:
+            self.values[key] = value
+            self.values.move_to_end(key)
+            while len(self.values) > self.maxsize:
+                self.values.popitem(last=False)
+        return value
+
+    def evict(self, key):
+        with self.lock:
+            self.values.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+_timescale = None
+_satellites = LruCache(SATELLITE_CACHE_SIZE)
+_observers = LruCache(OBSERVER_CACHE_SIZE)
+
+def get_timescale():
+    """The process-wide Skyfield timescale, loaded on first use."""
+    global _timescale
+    if _timescale is None:
+        _timescale = load.timescale()
+    return _timescale
+
+def get_satellite(tle1, tle2):
+    """EarthSatellite for a TLE, parsed once per distinct pair of lines."""
+    return _satellites.get((tle1, tle2), lambda: EarthSatellite(tle1, tle2, 'SAT', get_timescale()))
+
+def get_observer(location_id, lat, lon, elev):
+    """Observer for a location row, built once per location id; call
+    evict_observer when the location's coordinates change.  Without an
+    id the observer is built and not cached."""
+    if location_id is None:
+        return wgs84.latlon(lat, lon, elevation_m=elev)
+    return _observers.get(location_id, lambda: wgs84.latlon(lat, lon, elevation_m=elev))
+
+def evict_observer(location_id):
+    _observers.evict(location_id)
+
+def complete_passes(satellite, observer, t_events, events):
+    """(aos, culmination, los, max_elevation_deg) for each rise, culminate,
+    set sequence in find_events output; partial passes are skipped.  The
+    culmination altitudes come from one vectorized .at() call."""
+    starts = []
+    i = 0
+    while i + 2 < len(events):
+        if events[i] == 0 and events[i+1] == 1 and events[i+2] == 2:
+            starts.append(i)
+            i += 3
+        else:
+            i += 1
+    if not starts:
+        return []
+    alt, _, _ = (satellite - observer).at(t_events[[i + 1 for i in starts]]).altaz()
+    return [(t_events[i], t_events[i+1], t_events[i+2], max_elev_deg)
+            for i, max_elev_deg in zip(starts, alt.degrees)]
+
+def passes_between(satellite, observer, ts, start, end, min_elevation=10.0):
+    """Every complete pass with AOS after `start` and LOS before `end`
+    (aware datetimes), from one event search over the whole window."""
+    t_events, events = satellite.find_events(observer, ts.from_datetime(start), ts.from_datetime(end),
+                                             altitude_degrees=min_elevation)
+    return complete_passes(satellite, observer, t_events, events)
+
 def find_next_passes(satellite, observer, ts, count=3, min_elevation=10.0):
     now = datetime.now(pytz.UTC)
     t0 = ts.utc(now)
@@ -16,18 +103,8 @@ def find_next_passes(satellite, observer, ts, count=3, min_elevation=10.0):
         t1 = ts.utc(now + timedelta(hours=hours + 6))
         t_events, events = satellite.find_events(observer, t0, t1, altitude_degrees=min_elevation)
 
-        i = 0
-        while i + 2 < len(events):
-            if events[i] == 0 and events[i+1] == 1 and events[i+2] == 2:
-                max_elev_time = t_events[i+1] 
-                alt, _, _ = (satellite - observer).at(max_elev_time).altaz() 
-                max_elev_deg = alt.degrees 
-                passes.append((t_events[i], t_events[i+1], t_events[i+2], max_elev_deg))
-                if len(passes) == count:
-                    break
-                i += 3
-            else:
-                i += 1
+        passes.extend(complete_passes(satellite, observer, t_events, events))
+        del passes[count:]
 
         # Advance t0 to just after the last event we processed
         if len(t_events) > 0:
@@ -44,10 +121,24 @@ def find_next_passes(satellite, observer, ts, count=3, min_elevation=10.0):
         raise ValueError("No visible passes found in the next 72 hours.")
     return passes
 
-def generate_orbit_plots(tle1, tle2, lat, lon, elev, timezone_str="UTC"):
-    ts = load.timescale()
-    satellite = EarthSatellite(tle1, tle2, 'SAT', ts)
-    observer = wgs84.latlon(lat, lon, elevation_m=elev)
+def sky_track(satellite, observer, ts, passes, points=100):
+    """
+    Altitude and azimuth (degrees) at `points` evenly spaced times from AOS
+    to LOS of each pass, as two (len(passes), points) arrays.  All passes are
+    propagated in one vectorized .at() call.
+    """
+    jd = np.array([np.linspace(aos.tt, los.tt, points) for aos, _, los, _ in passes])
+    times = ts.tt_jd(jd.ravel())
+    alt, az, _ = (satellite - observer).at(times).altaz()
+    return alt.degrees.reshape(jd.shape), az.degrees.reshape(jd.shape)
+
+def generate_orbit_plots(tle1, tle2, lat, lon, elev, timezone_str="UTC", location_id=None, passes=None):
+    """Pass table and sky tracks (alt/az arrays) for the next passes;
+    `passes` (as from find_next_passes) skips the event search when they
+    are already known."""
+    ts = get_timescale()
+    satellite = get_satellite(tle1, tle2)
+    observer = get_observer(location_id, lat, lon, elev)
 
     # Validate timezone
     try:
@@ -55,47 +146,25 @@ def generate_orbit_plots(tle1, tle2, lat, lon, elev, timezone_str="UTC"):
     except pytz.UnknownTimeZoneError:
         tz = pytz.UTC
 
-    passes = find_next_passes(satellite, observer, ts, count=3)
+    if not passes:
+        passes = find_next_passes(satellite, observer, ts, count=3)
     next_pass = passes[0]
     aos_utc = next_pass[0].utc_datetime().replace(tzinfo=pytz.UTC)
     los_utc = next_pass[2].utc_datetime().replace(tzinfo=pytz.UTC)
     now_utc = datetime.now(pytz.UTC)
     countdown_sec = int((aos_utc - now_utc).total_seconds())
 
-    # Plotting
-    fig = plt.figure(figsize=(6, 6))
-    ax = fig.add_subplot(111, polar=True)
-
-    for aos, max_elev, los, max_elev_deg in passes:
-        times = ts.utc(np.linspace(aos.utc_datetime(), los.utc_datetime(), 100))
-        altitudes = []
-        azimuths = []
-
-        for t in times:
-            difference = satellite - observer
-            topocentric = difference.at(t)
-            alt, az, _ = topocentric.altaz()
-            altitudes.append(alt.degrees)
-            azimuths.append(az.degrees)
-
-        az_rad = np.radians(azimuths)
-        alt_inv = [90 - a for a in altitudes]
+    # Sky tracks; render_skyplot draws them, or the browser does
+    tracks = []
+    altitudes, azimuths = sky_track(satellite, observer, ts, passes)
+    for (aos, max_elev, los, max_elev_deg), alt, az in zip(passes, altitudes, azimuths):
         aos_local = aos.utc_datetime().replace(tzinfo=pytz.UTC).astimezone(tz)
-        label = aos_local.strftime('%H:%M %Z')
-        ax.plot(az_rad, alt_inv, label=label)
-
-    ax.set_theta_zero_location('N')
-    ax.set_theta_direction(-1)
-    ax.set_rlim(0, 90)
-    ax.set_title("Upcoming Visible Passes")
-    ax.legend(loc='lower left', fontsize='small')
+        tracks.append({
+            "label": aos_local.strftime('%H:%M %Z'),
+            "alt_deg": np.round(alt, 2).tolist(),
+            "az_deg": np.round(az, 2).tolist(),
+        })
 
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png')
-    buf.seek(0)
-    skyplot_b64 = base64.b64encode(buf.read()).decode('utf-8')
-    plt.close(fig)
-    
     pass_list = [] 
     for aos, max_elev, los, max_elev_deg in passes:
         aos_dt = aos.utc_datetime().replace(tzinfo=pytz.UTC).astimezone(tz) 
@@ -109,9 +178,29 @@ def generate_orbit_plots(tle1, tle2, lat, lon, elev, timezone_str="UTC"):
         })
 
     return { 
-        "skyplot": skyplot_b64, 
         "aos": aos_utc.isoformat(), 
         "los": los_utc.isoformat(), 
         "countdown": countdown_sec, 
-        "passes": pass_list 
+        "passes": pass_list,
+        "tracks": tracks
     }
+
+def render_skyplot(tracks, fmt="png"):
+    """Polar sky plot (north up, zenith in the middle) of the tracks from
+    generate_orbit_plots, as PNG or SVG bytes."""
+    fig = plt.figure(figsize=(6, 6))
+    ax = fig.add_subplot(111, polar=True)
+
+    for track in tracks:
+        ax.plot(np.radians(track["az_deg"]), 90 - np.asarray(track["alt_deg"]), label=track["label"])
+
+    ax.set_theta_zero_location('N')
+    ax.set_theta_direction(-1)
+    ax.set_rlim(0, 90)
+    ax.set_title("Upcoming Visible Passes")
+    ax.legend(loc='lower left', fontsize='small')
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format=fmt)
+    plt.close(fig)
+    return buf.getvalue()
@@ -44,3 +44,14 @@ def resolve_storage_path(base_path, *parts):
     else:
         joined = os.path.join(get_app_root(), base_path, *parts)
     return os.path.abspath(joined)
+
+
+def human_size(size):
+    """Format a byte count as e.g. '1.5 GB'; None (unknown) gives 'N/A'."""
+    if size is None:
+        return "N/A"
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"